@@ -5,11 +5,21 @@ import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 from PIL import Image, ImageTk
 import platform
-import winsound
+if platform.system() == "Windows":
+    import winsound
 import logging
 import sys
-from typing import List, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from threading import Thread, Event, Lock
+import multiprocessing
+import queue
+import io
+import mmap
+import hashlib
+import json
+import time
+from contextlib import contextmanager
 import datetime
 import requests
 import zipfile
@@ -32,6 +42,31 @@ OUTPUT_DIR_ROOT = os.path.join(PROGRAM_DRIVE, "ChenFeiApp", "output")
 MAX_FILES = 5
 OUTPUT_DIR_NAME = "ChenFei_OK"
 THUMBNAIL_SIZE = (100, 100)
+DETECTION_MAX_SIDE = 1600  # 轮廓检测代理图的最大边长，None 表示在原图上检测
+DESKEW_TOLERANCE = 0.5  # 度；倾斜不超过该角度的照片直接按像素裁剪，不做插值
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+WORKER_COUNT = min(os.cpu_count() or 4, 61)  # Windows 进程池最多 61 个工作进程
+BACKENDS = {"process": "进程池", "thread": "线程池", "pipeline": "流水线"}
+PIPELINE_QUEUE_SIZE = 4  # 流水线各级之间最多排队的任务数
+PIPELINE_WRITERS = 2
+DEFAULT_BACKEND = "process"
+IN_FLIGHT_PER_WORKER = 2  # 每个工作线程最多排队的任务数，限制同时驻留内存的扫描图数量
+POLL_INTERVAL_MS = 100
+MAX_ERROR_DETAILS = 20
+MANIFEST_NAME = "split_manifest.jsonl"  # 输出目录中记录已分割扫描件的清单
+LOG_MAX_BYTES = 10 * 1024 * 1024  # 日志和耗时记录超过该大小时在启动时轮换为 .1
+# 各处理阶段：页级阶段每页一个耗时，照片级阶段每张照片一个耗时
+PAGE_STAGES = {"load": "读取解码", "preprocess": "预处理", "contour": "轮廓检测"}
+CROP_STAGES = {"warp": "透视校正", "border": "加边框", "encode": "编码", "save": "写盘"}
+# 耗时直方图的桶上界（毫秒），最后一个桶收纳更慢的记录
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# 照片筛选条件：面积占整页比例、长宽比、矩形度（凸包面积 / 最小外接矩形面积）、每页最多照片数
+DETECTION_CONFIG = {
+    "max_count": 8,
+    "min_area_ratio": 0.01,
+    "max_aspect": 6.0,
+    "min_rectangularity": 0.85,
+}
 STYLE_CONFIG = {
     "header_bg": "#34495e",
     "success_fg": "#27ae60",
@@ -41,73 +76,230 @@ STYLE_CONFIG = {
 }
 
 # 日志配置
+def rotate_file(path: str, max_bytes: int = LOG_MAX_BYTES):
+    """文件超过大小上限时改名为 .1（覆盖旧的 .1），保留上次的记录又不无限增长"""
+    try:
+        if os.path.getsize(path) > max_bytes:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass
+
+
 os.makedirs(LOG_DIR, exist_ok=True)
 log_file_path = os.path.join(LOG_DIR, 'app.log')
+metrics_file_path = os.path.join(LOG_DIR, 'metrics.jsonl')
+# 进程池工作进程启动时会重新导入本模块，只有主进程轮换；所有进程都追加写入，不再清空历史
+if multiprocessing.parent_process() is None:
+    rotate_file(log_file_path)
+    rotate_file(metrics_file_path)
 logging.basicConfig(
     filename=log_file_path,
     level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filemode='w'
+    format='%(asctime)s - %(process)d - %(levelname)s - %(message)s',
+    filemode='a',
+    encoding='utf-8'
 )
 
+# cv2.minAreaRect 的返回值：((中心x, 中心y), (宽, 高), 角度)
+Rect = Tuple[Tuple[float, float], Tuple[float, float], float]
+
 # 更新配置
 UPDATE_URL = "https://example.com/your-update-url"  # 替换为你的更新文件URL
 CURRENT_VERSION = "1.0"
 
+class PageResult(NamedTuple):
+    """单页扫描件的处理结果；skipped 表示清单中已有记录、本次未重新分割
+
+    timings 为 StageTimer.as_dict() 的各阶段耗时（秒）。
+    """
+    path: Optional[str]
+    outputs: List[str]
+    error: Optional[str] = None
+    skipped: bool = False
+    digest: Optional[str] = None
+    timings: Optional[dict] = None
+
+
+class StageTimer:
+    """记录一页扫描件各阶段的耗时（秒）：页级阶段按名称累加，照片级阶段按照片序号分别记录"""
+
+    def __init__(self):
+        self.page = {}
+        self.crops = []
+
+    def reserve(self, count: int):
+        """预先为每张照片分配记录，流水线中多个写出线程可以并发填写不同照片"""
+        self.crops = [{} for _ in range(count)]
+
+    @contextmanager
+    def stage(self, name: str, crop: Optional[int] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if crop is None:
+                self.page[name] = self.page.get(name, 0.0) + elapsed
+            else:
+                while len(self.crops) <= crop:
+                    self.crops.append({})
+                self.crops[crop][name] = self.crops[crop].get(name, 0.0) + elapsed
+
+    def as_dict(self) -> dict:
+        return {"page": dict(self.page), "crops": [dict(crop) for crop in self.crops]}
+
+
 # 图像处理核心模块
 class ImageProcessor:
+    # 本次运行中已确认可写的输出目录（每个进程各自缓存）
+    _writable_dirs = set()
+    _writable_lock = Lock()
+
     @staticmethod
-    def process_image(input_path: str, output_dir: str) -> List[str]:
-        """处理单张图像的主流程"""
+    def process_image(input_path: str, output_dir: str,
+                      detect_max_side: Optional[int] = DETECTION_MAX_SIDE,
+                      detection: Optional[dict] = None) -> List[str]:
+        """处理单张图像的主流程，detection 覆盖 DETECTION_CONFIG 中的筛选条件"""
+        return ImageProcessor.split_page(input_path, output_dir, detect_max_side, detection)[1]
+
+    @staticmethod
+    def split_page(input_path: str, output_dir: str,
+                   detect_max_side: Optional[int] = DETECTION_MAX_SIDE,
+                   detection: Optional[dict] = None) -> Tuple[str, List[str], dict]:
+        """分割单页扫描件，返回 (内容摘要, 输出文件列表, 各阶段耗时)
+
+        输出文件名由源文件名、内容摘要和照片序号决定，同一扫描件在任何机器上重跑结果都相同。
+        """
         try:
             if not os.path.isfile(input_path):
                 raise FileNotFoundError(f"输入文件不存在：{input_path}")
 
-            with Image.open(input_path) as pil_image:
-                if pil_image.mode == 'RGBA':
-                    pil_image = pil_image.convert('RGB')
-                image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-
-            processed = ImageProcessor._preprocess_image(image)
-            contours = ImageProcessor._find_contours(processed)
-            return ImageProcessor._process_contours(image, contours, input_path, output_dir)
+            timer = StageTimer()
+            with timer.stage("load"):
+                with open(input_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest = ImageProcessor._digest(mapped)
+                    image = ImageProcessor._load_image(mapped)
+            rects = ImageProcessor._detect_rects(image, detect_max_side, detection, timer)
+            outputs = ImageProcessor._process_contours(image, rects, input_path, output_dir, digest, timer)
+            return digest, outputs, timer.as_dict()
 
         except Exception as e:
             logging.error(f"处理失败：{str(e)}", exc_info=True)
             raise
 
+    @staticmethod
+    def _digest(data) -> str:
+        """扫描件内容摘要（SHA-1），用于确定输出文件名和识别已分割的页面"""
+        return hashlib.sha1(data).hexdigest()
+
+    @staticmethod
+    def _load_image(source: Union[str, bytes, mmap.mmap]) -> np.ndarray:
+        """解码为 BGR 数组，source 可以是路径、已读入内存或已映射的文件内容
+
+        cv2.imdecode 直接解码出 BGR，省去 PIL 解码、np.array 和 RGB→BGR 三次整帧复制；
+        路径通过内存映射交给解码器（支持中文路径，文件内容不再复制一份）。
+        与原 PIL 路径一致，不按 EXIF 方向旋转。OpenCV 不支持的格式回退到 PIL。
+        """
+        if isinstance(source, str):
+            with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return ImageProcessor._load_image(mapped)
+
+        buffer = np.frombuffer(source, np.uint8)
+        try:
+            image = cv2.imdecode(buffer, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        finally:
+            del buffer  # 映射被引用时无法关闭
+        if image is not None:
+            return image
+
+        with Image.open(io.BytesIO(source)) as pil_image:
+            if pil_image.mode != 'RGB':
+                pil_image = pil_image.convert('RGB')
+            return cv2.cvtColor(np.asarray(pil_image), cv2.COLOR_RGB2BGR)
+
+    @staticmethod
+    def _detect_rects(image: np.ndarray, max_side: Optional[int] = DETECTION_MAX_SIDE,
+                      detection: Optional[dict] = None, timer: Optional[StageTimer] = None) -> List[Rect]:
+        """在缩小的代理图上检测轮廓，把最小外接矩形映射回原图坐标
+
+        检测只需近似结果，代理图尺寸固定后检测耗时与扫描 DPI 无关。
+        先转灰度再按整数倍缩小，INTER_AREA 走整数倍均值的快速路径。
+        """
+        timer = timer or StageTimer()
+        with timer.stage("preprocess"):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            factor = -(-max(gray.shape) // max_side) if max_side else 1
+            if factor > 1:
+                gray = cv2.resize(gray, None, fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA)
+            mask = ImageProcessor._preprocess_image(gray)
+
+        with timer.stage("contour"):
+            rects = ImageProcessor._find_contours(mask, detection)
+            if factor == 1:
+                return rects
+
+            # 代理图像素中心 x 对应原图 (x + 0.5) * factor - 0.5，批量换算
+            geometry = np.array([(cx, cy, w, h) for (cx, cy), (w, h), _ in rects], dtype=np.float64)
+            geometry[:, :2] = (geometry[:, :2] + 0.5) * factor - 0.5
+            geometry[:, 2:] *= factor
+            return [((cx, cy), (w, h), angle)
+                    for (cx, cy, w, h), (_, _, angle) in zip(geometry.tolist(), rects)]
+
     @staticmethod
     def _preprocess_image(image: np.ndarray) -> np.ndarray:
-        """图像预处理管道"""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        """图像预处理管道（接受 BGR 或灰度图）"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
         _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
         return cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
 
     @staticmethod
-    def _find_contours(image: np.ndarray) -> List[np.ndarray]:
-        """寻找有效轮廓"""
+    def _find_contours(image: np.ndarray, detection: Optional[dict] = None) -> List[Rect]:
+        """寻找有效轮廓，按面积从大到小返回其最小外接矩形
+
+        过小的碎屑、细长的折痕和不规则的污渍在这里剔除，不再进入校正和保存。
+        """
+        config = {**DETECTION_CONFIG, **(detection or {})}
         contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         if not contours:
             raise RuntimeError("未检测到有效轮廓")
-        return sorted(contours, key=cv2.contourArea, reverse=True)[:4]
+
+        min_area = config["min_area_ratio"] * image.shape[0] * image.shape[1]
+        candidates = []
+        for cnt in contours:
+            area = cv2.contourArea(cnt)
+            if area < min_area:
+                continue
+            rect = cv2.minAreaRect(cnt)
+            w, h = rect[1]
+            if min(w, h) < 1 or max(w, h) / min(w, h) > config["max_aspect"]:
+                continue
+            # 用凸包面积：照片边缘的浅色区域被阈值化掉形成的缺口不影响判断
+            if cv2.contourArea(cv2.convexHull(cnt)) / (w * h) < config["min_rectangularity"]:
+                continue
+            candidates.append((area, rect))
+
+        if not candidates:
+            raise RuntimeError(f"未检测到符合条件的照片（共 {len(contours)} 个轮廓均被过滤）")
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return [rect for _, rect in candidates[:config["max_count"]]]
 
     @staticmethod
-    def _process_contours(original: np.ndarray, contours: List[np.ndarray],
-                          input_path: str, output_dir: str) -> List[str]:
-        """处理所有检测到的轮廓"""
+    def _process_contours(original: np.ndarray, rects: List[Rect],
+                          input_path: str, output_dir: str, digest: str,
+                          timer: Optional[StageTimer] = None) -> List[str]:
+        """处理所有检测到的轮廓（以原图坐标下的最小外接矩形表示）"""
         output_files = []
-        base_name = os.path.splitext(os.path.basename(input_path))[0]
-        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")[:-3]
+        timer = timer or StageTimer()
+        timer.reserve(len(rects))
 
-        for idx, cnt in enumerate(contours):
+        for idx, rect in enumerate(rects):
             try:
-                warped = ImageProcessor._warp_perspective(original, cnt)
-                bordered = cv2.copyMakeBorder(warped, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=(255, 255, 255))
-                output_path = os.path.join(output_dir, f"{base_name}_{timestamp}_{idx:02d}.jpg")
+                bordered = ImageProcessor._crop(original, rect, timer, idx)
+                output_path = ImageProcessor._output_path(input_path, output_dir, digest, idx)
 
-                if ImageProcessor._save_image(output_path, bordered):
+                if ImageProcessor._save_image(output_path, bordered, timer, idx):
                     output_files.append(output_path)
             except Exception as e:
                 logging.error(f"轮廓{idx}处理失败：{str(e)}")
@@ -118,58 +310,561 @@ class ImageProcessor:
         return output_files
 
     @staticmethod
-    def _warp_perspective(image: np.ndarray, contour: np.ndarray) -> np.ndarray:
-        """透视变换核心逻辑"""
-        rect = cv2.minAreaRect(contour)
+    def _output_path(input_path: str, output_dir: str, digest: str, idx: int) -> str:
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        return os.path.join(output_dir, f"{base_name}_{digest[:12]}_{idx:02d}.jpg")
+
+    @staticmethod
+    def _crop(original: np.ndarray, rect: Rect, timer: Optional[StageTimer] = None,
+              idx: Optional[int] = None) -> np.ndarray:
+        """校正单张照片并加白边"""
+        timer = timer or StageTimer()
+        with timer.stage("warp", idx):
+            warped = ImageProcessor._warp_perspective(original, rect)
+        with timer.stage("border", idx):
+            return cv2.copyMakeBorder(warped, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+
+    @staticmethod
+    def _warp_perspective(image: np.ndarray, rect: Rect) -> np.ndarray:
+        """透视变换核心逻辑
+
+        最小外接矩形的四角映射到矩形，变换实际是仿射的：接近 0°/90° 倍数时直接切片取像素，
+        其余角度用 warpAffine，只有变换确实含透视分量时才用 warpPerspective。
+        """
         box = cv2.boxPoints(rect)
         width, height = ImageProcessor._calculate_size(rect)
 
         dst = np.array([[0, height - 1], [0, 0], [width - 1, 0], [width - 1, height - 1]], dtype="float32")
         M = cv2.getPerspectiveTransform(box, dst)
-        warped = cv2.warpPerspective(image, M, (width, height))
+        if np.allclose(M[2], (0, 0, 1), atol=1e-6):
+            warped = ImageProcessor._axis_aligned_crop(image, M[:2], rect[0], width, height)
+            if warped is None:
+                warped = cv2.warpAffine(image, M[:2], (width, height))
+        else:
+            warped = cv2.warpPerspective(image, M, (width, height))
 
         if warped.size == 0:
             raise ValueError("透视变换返回空图像")
         return warped
 
     @staticmethod
-    def _calculate_size(rect: Tuple[Tuple[float, float], Tuple[float, float], float]) -> Tuple[int, int]:
+    def _axis_aligned_crop(image: np.ndarray, affine: np.ndarray, center: Tuple[float, float],
+                           width: int, height: int) -> Optional[np.ndarray]:
+        """倾斜在 DESKEW_TOLERANCE 以内时按切片裁剪，返回原图视图（转置/翻转处理 90° 倍数）
+
+        变换的线性部分取整为带符号的置换矩阵 S，平移取整后每个输出像素对应唯一的原图像素。
+        倾斜超出容差或裁剪区域越出原图（需要黑边填充）时返回 None。
+        """
+        linear = affine[:, :2]
+        scale = np.sqrt(abs(np.linalg.det(linear)))
+        if scale == 0:
+            return None
+        S = np.round(linear / scale)
+        if (np.abs(S).sum(axis=0) != 1).any() or (np.abs(S).sum(axis=1) != 1).any():
+            return None
+        if np.abs(linear / scale - S).max() > np.sin(np.radians(DESKEW_TOLERANCE)):
+            return None
+
+        # 输出 = S · 原图 + t，t 取整使矩形中心对齐；原图坐标 = Sᵀ · (输出 - t)
+        t = np.round(np.array([(width - 1) / 2, (height - 1) / 2]) - S @ np.asarray(center))
+        corners = (np.array([[0, 0], [width - 1, height - 1]]) - t) @ S
+        x0, y0 = corners.min(axis=0).astype(int)
+        x1, y1 = corners.max(axis=0).astype(int)
+        if x0 < 0 or y0 < 0 or x1 >= image.shape[1] or y1 >= image.shape[0]:
+            return None
+
+        roi = image[y0:y1 + 1, x0:x1 + 1]
+        if S[0, 0] == 0:
+            # 90°/270°：输出的行随原图 x 变化、列随原图 y 变化
+            return roi.swapaxes(0, 1)[::int(S[1, 0]), ::int(S[0, 1])]
+        return roi[::int(S[1, 1]), ::int(S[0, 0])]
+
+    @staticmethod
+    def _calculate_size(rect: Rect) -> Tuple[int, int]:
         """计算实际尺寸"""
         _, (w, h), angle = rect
         return (int(h), int(w)) if angle < -45 else (int(w), int(h))
 
     @staticmethod
-    def _save_image(output_path: str, image: np.ndarray) -> bool:
-        """安全保存图像"""
-        try:
-            output_path = os.path.abspath(output_path)
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-            # 检查写入权限
-            test_file = os.path.join(os.path.dirname(output_path), "test_permission.txt")
-            with open(test_file, "w") as f:
-                f.write("test")
-            os.remove(test_file)
+    def _ensure_output_dir(directory: str):
+        """创建输出目录并确认可写，每个目录每次运行只检查一次"""
+        key = os.path.normcase(directory)
+        if key in ImageProcessor._writable_dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.TemporaryFile(dir=directory):
+            pass
+        with ImageProcessor._writable_lock:
+            ImageProcessor._writable_dirs.add(key)
 
-            success = cv2.imwrite(output_path, image)
+    @staticmethod
+    def _save_image(output_path: str, image: np.ndarray, timer: Optional[StageTimer] = None,
+                    idx: Optional[int] = None) -> bool:
+        """安全保存图像：编码后一次写入，写入失败时清理残留文件"""
+        output_path = os.path.abspath(output_path)
+        directory = os.path.dirname(output_path)
+        timer = timer or StageTimer()
+        try:
+            with timer.stage("encode", idx):
+                success, encoded = cv2.imencode(os.path.splitext(output_path)[1], image)
             if not success:
-                raise RuntimeError("OpenCV写入失败")
+                raise RuntimeError("OpenCV编码失败")
+            with timer.stage("save", idx):
+                ImageProcessor._ensure_output_dir(directory)
+                # 用 Python 文件写入代替 cv2.imwrite：支持中文路径，失败时能拿到具体的系统错误
+                with open(output_path, "wb") as f:
+                    try:
+                        f.write(encoded)
+                    except OSError:
+                        f.close()
+                        os.remove(output_path)
+                        raise
             logging.info(f"成功保存文件到：{output_path}")
             return True
-        except PermissionError as e:
-            logging.error(f"权限拒绝：{output_path} - {str(e)}")
+        except OSError as e:
+            # 目录可能在运行中被删除或改了权限，下次保存时重新检查
+            with ImageProcessor._writable_lock:
+                ImageProcessor._writable_dirs.discard(os.path.normcase(directory))
+            if isinstance(e, PermissionError):
+                logging.error(f"权限拒绝：{output_path} - {str(e)}")
+            else:
+                logging.error(f"文件保存失败：{output_path} - {str(e)}")
             return False
         except Exception as e:
             logging.error(f"文件保存失败：{output_path} - {str(e)}")
             return False
 
 
+# 批量处理模块
+def iter_image_files(directory: str, skip_dirs: Tuple[str, ...] = ()) -> Iterator[str]:
+    """流式遍历目录（含子目录）中的图片，边扫描边产出，不预先收集完整列表"""
+    skip = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.normcase(os.path.abspath(entry.path)) not in skip:
+                            subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield entry.path
+                stack.extend(sorted(subdirs, reverse=True))
+        except OSError as e:
+            logging.error(f"无法读取目录：{current} - {str(e)}")
+
+
+def opencv_thread_budget(workers: int) -> int:
+    """每个工作者分到的 OpenCV 线程数，使 工作者数 × OpenCV 线程数 ≈ CPU 核数"""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _init_worker(cv_threads: int):
+    """进程池工作进程初始化：限定 OpenCV 线程数，避免多进程叠加 OpenCV 内部线程超额占用核心"""
+    cv2.setUseOptimized(True)
+    cv2.setNumThreads(cv_threads)
+
+
+class SplitManifest:
+    """输出目录中的已分割清单（JSON Lines，每页一行，只追加）
+
+    重跑时先按路径、大小和修改时间匹配，不读文件；文件被移动或复制时，
+    仅对大小相同的候选计算内容摘要再匹配。检测参数不同或输出文件缺失的记录不算已分割。
+    skip_existing 为 False 时只记录不跳过（强制重新分割）。
+    """
+
+    def __init__(self, output_dir: str, skip_existing: bool = True):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.output_dir = output_dir
+        self.skip_existing = skip_existing
+        self.by_path = {}
+        self.by_digest = {}
+        self.sizes = set()
+        self.lock = Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._index(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue  # 中断写入留下的残行
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    @staticmethod
+    def detection_key(detection: Optional[dict]) -> dict:
+        return {**DETECTION_CONFIG, **(detection or {}), "detect_max_side": DETECTION_MAX_SIDE}
+
+    def _index(self, entry: dict):
+        self.by_path[self._key(entry["source"])] = entry
+        self.by_digest[entry["digest"]] = entry
+        self.sizes.add(entry["size"])
+
+    def lookup(self, path: str, detection: Optional[dict] = None) -> Optional[PageResult]:
+        """已分割且输出齐全时返回跳过结果，否则返回 None"""
+        if not self.skip_existing:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.by_path.get(self._key(path))
+            if entry is None or (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                entry = None
+                if stat.st_size in self.sizes:
+                    try:
+                        with open(path, "rb") as f:
+                            entry = self.by_digest.get(ImageProcessor._digest(f.read()))
+                    except OSError:
+                        return None
+        if entry is None or entry["detection"] != self.detection_key(detection):
+            return None
+        outputs = [os.path.join(self.output_dir, name) for name in entry["outputs"]]
+        if not all(os.path.isfile(output) for output in outputs):
+            return None
+        return PageResult(path, outputs, skipped=True, digest=entry["digest"])
+
+    def record(self, path: str, digest: str, outputs: List[str], detection: Optional[dict] = None):
+        """记录一页的分割结果并立即追加到清单文件，中途停止后重跑可接着处理"""
+        stat = os.stat(path)
+        entry = {
+            "source": os.path.abspath(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": digest,
+            "detection": self.detection_key(detection),
+            "outputs": [os.path.basename(output) for output in outputs],
+            "processed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        with self.lock:
+            self._index(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class StageMetrics:
+    """各阶段耗时：每页一条 JSON 记录追加到耗时记录文件，同时累计到固定分桶的直方图
+
+    直方图只保存计数，处理任意多页内存占用都不变；summary() 给出界面上的汇总文字。
+    """
+
+    def __init__(self, path: Optional[str] = metrics_file_path):
+        self.path = path
+        self.pages = 0
+        self.crops = 0
+        self.stages = {name: {"count": 0, "total": 0.0, "max": 0.0,
+                              "buckets": [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)}
+                       for name in (*PAGE_STAGES, *CROP_STAGES)}
+
+    def _add(self, name: str, seconds: float):
+        stage = self.stages[name]
+        stage["count"] += 1
+        stage["total"] += seconds
+        stage["max"] = max(stage["max"], seconds)
+        ms = seconds * 1000
+        stage["buckets"][next((i for i, bound in enumerate(HISTOGRAM_BOUNDS_MS) if ms <= bound),
+                              len(HISTOGRAM_BOUNDS_MS))] += 1
+
+    def record(self, result: PageResult, backend: str):
+        timings = result.timings or {"page": {}, "crops": []}
+        self.pages += 1
+        self.crops += len(timings["crops"])
+        for name, seconds in timings["page"].items():
+            self._add(name, seconds)
+        for crop in timings["crops"]:
+            for name, seconds in crop.items():
+                self._add(name, seconds)
+
+        if self.path is None:
+            return
+        entry = {
+            "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "source": result.path,
+            "digest": result.digest,
+            "backend": backend,
+            "status": "error" if result.error else "ok",
+            "outputs": len(result.outputs),
+            "busy": round(sum(timings["page"].values()) + sum(sum(c.values()) for c in timings["crops"]), 6),
+            "page": {name: round(seconds, 6) for name, seconds in timings["page"].items()},
+            "crops": [{name: round(seconds, 6) for name, seconds in crop.items()} for crop in timings["crops"]],
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.error(f"写入耗时记录失败：{str(e)}")
+
+    def percentile_ms(self, name: str, pct: float) -> float:
+        """按直方图估算分位数，返回所在桶的上界（毫秒）"""
+        stage = self.stages[name]
+        target = stage["count"] * pct / 100
+        seen = 0
+        for bound, count in zip((*HISTOGRAM_BOUNDS_MS, stage["max"] * 1000), stage["buckets"]):
+            seen += count
+            if seen >= target:
+                return bound
+        return stage["max"] * 1000
+
+    def summary(self) -> List[str]:
+        """每个阶段一行：累计耗时占比、平均耗时和 P95"""
+        busy = sum(stage["total"] for stage in self.stages.values())
+        if not busy:
+            return []
+        lines = [f"共 {self.pages} 页、{self.crops} 张照片，累计处理耗时 {busy:.1f} 秒"]
+        for name, label in {**PAGE_STAGES, **CROP_STAGES}.items():
+            stage = self.stages[name]
+            if not stage["count"]:
+                continue
+            lines.append(f"{label}：{stage['total'] / busy:.0%}，平均 {stage['total'] / stage['count'] * 1000:.0f}ms，"
+                         f"P95 ≤ {self.percentile_ms(name, 95):.0f}ms")
+        return lines
+
+
+class StagedPipeline:
+    """读取 → 检测 → 校正 → 编码写出 四级流水线，级间以有界队列相连
+
+    第 N 页检测时第 N+1 页正在读盘、第 N-1 页的照片正在编码写出，磁盘 I/O 与计算重叠。
+    各级在本进程的线程中运行（解码、OpenCV 运算和文件读写都会释放 GIL），
+    队列有界，同时驻留内存的页数与批量大小无关。
+    """
+    _DONE = object()
+
+    def __init__(self, workers: int = WORKER_COUNT, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 detect_max_side: Optional[int] = DETECTION_MAX_SIDE):
+        self.compute_threads = max(1, workers // 2)
+        self.queue_size = queue_size
+        self.detect_max_side = detect_max_side
+
+    def run(self, paths: Iterable[str], output_dir: str,
+            should_stop: Optional[Callable[[], bool]] = None,
+            detection: Optional[dict] = None,
+            manifest: Optional[SplitManifest] = None) -> Iterator[PageResult]:
+        """与 BatchRunner.run 相同：逐个产出 PageResult"""
+        read_q = queue.Queue(self.queue_size)
+        detect_q = queue.Queue(self.queue_size)
+        write_q = queue.Queue(self.queue_size * 4)
+        results = queue.Queue()
+        abort = Event()
+        pages = {}  # 提交序号 -> 在途页面状态；同一路径可能被提交两次，不能按路径区分
+        pages_lock = Lock()
+
+        def fail(path, error):
+            logging.error(f"处理失败：{path} - {error}")
+            results.put(PageResult(path, [], error))
+
+        def read():
+            for seq, path in enumerate(paths):
+                if abort.is_set() or (should_stop and should_stop()):
+                    break
+                done = manifest.lookup(path, detection) if manifest is not None else None
+                if done is not None:
+                    results.put(done)
+                    continue
+                timer = StageTimer()
+                try:
+                    with timer.stage("load"), open(path, "rb") as f:
+                        data = f.read()
+                except OSError as e:
+                    fail(path, str(e))
+                    continue
+                read_q.put((seq, path, data, timer))
+
+        def detect(item):
+            seq, path, data, timer = item
+            try:
+                with timer.stage("load"):
+                    image = ImageProcessor._load_image(data)
+                    digest = ImageProcessor._digest(data)
+                rects = ImageProcessor._detect_rects(image, self.detect_max_side, detection, timer)
+                if not rects:
+                    raise RuntimeError("未检测到有效轮廓")
+            except Exception as e:
+                fail(path, str(e))
+                return
+            timer.reserve(len(rects))
+            with pages_lock:
+                pages[seq] = {"remaining": len(rects), "outputs": [], "digest": digest, "timer": timer}
+            detect_q.put((seq, path, image, rects, digest, timer))
+
+        def warp(item):
+            seq, path, image, rects, digest, timer = item
+            for idx, rect in enumerate(rects):
+                try:
+                    crop = ImageProcessor._crop(image, rect, timer, idx)
+                except Exception as e:
+                    logging.error(f"轮廓{idx}处理失败：{str(e)}")
+                    crop = None
+                write_q.put((seq, path, ImageProcessor._output_path(path, output_dir, digest, idx), crop, timer, idx))
+
+        def write(item):
+            seq, path, output_path, crop, timer, idx = item
+            saved = crop is not None and ImageProcessor._save_image(output_path, crop, timer, idx)
+            with pages_lock:
+                page = pages[seq]
+                if saved:
+                    page["outputs"].append(output_path)
+                page["remaining"] -= 1
+                if page["remaining"]:
+                    return
+                del pages[seq]
+            if page["outputs"]:
+                results.put(PageResult(path, sorted(page["outputs"]), digest=page["digest"],
+                                       timings=page["timer"].as_dict()))
+            else:
+                fail(path, "所有轮廓处理均失败")
+
+        def stage(func, inbox, outbox, threads):
+            """启动一级的工作线程；全部退出后向下一级发送结束标记"""
+            def loop():
+                while True:
+                    item = inbox.get()
+                    if item is self._DONE:
+                        inbox.put(self._DONE)  # 让同级其他线程也能看到结束标记
+                        return
+                    if not abort.is_set():
+                        func(item)
+
+            workers = [Thread(target=loop, daemon=True) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+
+            def close():
+                for worker in workers:
+                    worker.join()
+                outbox.put(self._DONE)
+            Thread(target=close, daemon=True).start()
+
+        def source():
+            try:
+                read()
+            finally:
+                read_q.put(self._DONE)
+
+        Thread(target=source, daemon=True).start()
+        stage(detect, read_q, detect_q, self.compute_threads)
+        stage(warp, detect_q, write_q, self.compute_threads)
+        stage(write, write_q, results, PIPELINE_WRITERS)
+        try:
+            while True:
+                result = results.get()
+                if result is self._DONE:
+                    return
+                yield result
+        finally:
+            # 调用方提前放弃时让各级丢弃剩余任务，只传递结束标记
+            abort.set()
+
+
+class BatchRunner:
+    """持久化工作池：任意数量的扫描图按有界在途窗口提交，内存占用与批量大小无关
+
+    backend 为 "process" 时每张图在独立进程中处理，解码、轮廓排序和保存不再争抢 GIL；
+    "thread" 时在本进程的线程池中处理，启动开销小，适合少量文件；
+    "pipeline" 时按 StagedPipeline 分级处理，读盘与计算重叠，适合机械硬盘上的扫描存档。
+    """
+
+    def __init__(self, workers: int = WORKER_COUNT, backend: str = DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的并行方式：{backend}")
+        self.workers = workers
+        self.backend = backend
+        self.cv_threads = opencv_thread_budget(workers)
+        self.executor = None
+        self.pipeline = None
+        if backend == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(self.cv_threads,))
+        elif backend == "pipeline":
+            self.pipeline = StagedPipeline(workers)
+            self.cv_threads = opencv_thread_budget(self.pipeline.compute_threads * 2)
+            cv2.setNumThreads(self.cv_threads)
+        else:
+            # 线程共享本进程的 OpenCV 线程池，同样按工作者数分摊
+            cv2.setNumThreads(self.cv_threads)
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="splitter")
+        logging.info(f"工作池：{BACKENDS[backend]} × {workers}，每个工作者 OpenCV 线程数 {self.cv_threads}")
+
+    def run(self, paths: Iterable[str], output_dir: str,
+            should_stop: Optional[Callable[[], bool]] = None,
+            detection: Optional[dict] = None,
+            manifest: Optional[SplitManifest] = None,
+            metrics: Optional["StageMetrics"] = None) -> Iterator[PageResult]:
+        """逐个产出 PageResult，完成顺序即产出顺序
+
+        should_stop 返回 True 后不再提交新任务，已在途的任务处理完后结束。
+        detection 覆盖 DETECTION_CONFIG 中的照片筛选条件。
+        给出 manifest 时跳过清单中已分割的页面，并把新分割的页面记入清单。
+        给出 metrics 时每页的各阶段耗时写入耗时记录并计入直方图。
+        """
+        if self.pipeline is not None:
+            results = self.pipeline.run(paths, output_dir, should_stop, detection, manifest)
+        else:
+            results = self._run_pool(paths, output_dir, should_stop, detection, manifest)
+        for result in results:
+            if metrics is not None and not result.skipped and result.path:
+                metrics.record(result, self.backend)
+            if manifest is not None and result.digest and not result.skipped:
+                try:
+                    manifest.record(result.path, result.digest, result.outputs, detection)
+                except OSError as e:
+                    logging.error(f"写入分割清单失败：{str(e)}")
+            yield result
+
+    def _run_pool(self, paths: Iterable[str], output_dir: str,
+                  should_stop: Optional[Callable[[], bool]], detection: Optional[dict],
+                  manifest: Optional[SplitManifest]) -> Iterator[PageResult]:
+        """进程池/线程池：有界在途窗口提交"""
+        window = self.workers * IN_FLIGHT_PER_WORKER
+        paths = iter(paths)
+        pending = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window and not (should_stop and should_stop()):
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+                done = manifest.lookup(path, detection) if manifest is not None else None
+                if done is not None:
+                    yield done
+                    continue
+                future = self.executor.submit(ImageProcessor.split_page, path, output_dir,
+                                              DETECTION_MAX_SIDE, detection)
+                pending[future] = path
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    digest, outputs, timings = future.result()
+                except Exception as e:
+                    yield PageResult(path, [], str(e))
+                else:
+                    yield PageResult(path, outputs, digest=digest, timings=timings)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 # GUI界面模块
 class ImageProcessorApp:
     def __init__(self, root: tk.Tk):
         self.root = root
         self.file_entries: List[dict] = []
         self.thumbnails: List[ttk.Label] = []
+        self.runner: Optional[BatchRunner] = None
+        self.result_queue: queue.Queue = queue.Queue()
+        self.stop_event = Event()
+        self.batch_stats: Optional[dict] = None
         self._init_ui()
         self._setup_window()
         self._check_for_updates()
@@ -186,6 +881,7 @@ class ImageProcessorApp:
         self.root.title("ChenFei AI分割照片专业版 v1.0")
         self.root.geometry("1000x680+200+100")
         self.root.minsize(1000, 680)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
     def _configure_styles(self):
         """配置界面样式"""
@@ -309,10 +1005,13 @@ class ImageProcessorApp:
         2. 智能分割成多张独立照片
         3. AI自动识别并摆正照片
         4. 多线同时处理最多5张照片
+        5. 文件夹批量模式不限数量
+        6. 自动过滤污渍、折痕等非照片区域
 
         🎮 使用提示：
         • 点击"选择照片"按钮添加图片
         • 点击"✕"按钮可清除已选文件
+        • 点击"批量处理文件夹"处理整个目录
         • 处理完成后自动打开输出目录
 
         🎉 祝您使用愉快！"""
@@ -341,11 +1040,48 @@ class ImageProcessorApp:
         self.progress = ttk.Progressbar(control_frame, mode="determinate")
         self.progress.pack(fill=tk.X, pady=5)
 
-        process_btn = ttk.Button(control_frame,
-                                 text="🚀 开始AI分割处理 🚀",
-                                 style="Process.TButton",
-                                 command=self._start_processing)
-        process_btn.pack(fill=tk.X, pady=5)
+        self.status_var = tk.StringVar()
+        ttk.Label(control_frame, textvariable=self.status_var).pack(fill=tk.X)
+
+        option_row = ttk.Frame(control_frame)
+        option_row.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(option_row, text="并行方式：").pack(side=tk.LEFT)
+        self.backend_var = tk.StringVar(value=BACKENDS[DEFAULT_BACKEND])
+        ttk.Combobox(option_row, textvariable=self.backend_var, values=list(BACKENDS.values()),
+                     state="readonly", width=8).pack(side=tk.LEFT)
+        ttk.Label(option_row, text="工作数：").pack(side=tk.LEFT, padx=(10, 0))
+        self.workers_var = tk.IntVar(value=WORKER_COUNT)
+        ttk.Spinbox(option_row, from_=1, to=WORKER_COUNT, textvariable=self.workers_var,
+                    width=5).pack(side=tk.LEFT)
+        ttk.Label(option_row, text="每页最多照片：").pack(side=tk.LEFT, padx=(10, 0))
+        self.max_count_var = tk.IntVar(value=DETECTION_CONFIG["max_count"])
+        ttk.Spinbox(option_row, from_=1, to=50, textvariable=self.max_count_var,
+                    width=5).pack(side=tk.LEFT)
+        ttk.Label(option_row, text="最小面积(%)：").pack(side=tk.LEFT, padx=(10, 0))
+        self.min_area_var = tk.DoubleVar(value=DETECTION_CONFIG["min_area_ratio"] * 100)
+        ttk.Spinbox(option_row, from_=0, to=50, increment=0.5, textvariable=self.min_area_var,
+                    width=5).pack(side=tk.LEFT)
+        self.skip_done_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(option_row, text="跳过已分割的扫描件",
+                        variable=self.skip_done_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        button_row = ttk.Frame(control_frame)
+        button_row.pack(fill=tk.X, pady=5)
+        self.process_btn = ttk.Button(button_row,
+                                      text="🚀 开始AI分割处理 🚀",
+                                      style="Process.TButton",
+                                      command=self._start_processing)
+        self.process_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.folder_btn = ttk.Button(button_row,
+                                     text="📂 批量处理文件夹",
+                                     style="Process.TButton",
+                                     command=self._start_folder_processing)
+        self.folder_btn.pack(side=tk.LEFT, padx=(5, 0))
+        self.stop_btn = ttk.Button(button_row,
+                                   text="⏹ 停止",
+                                   command=self.stop_event.set,
+                                   state=tk.DISABLED)
+        self.stop_btn.pack(side=tk.LEFT, padx=(5, 0))
 
     # 功能方法
     def _select_file(self, index: int):
@@ -404,34 +1140,153 @@ class ImageProcessorApp:
             return
 
         self._init_progress_bar(len(valid_files))
+        self._run_batch(valid_files, output_dir, total=len(valid_files))
+
+    def _start_folder_processing(self):
+        """文件夹批量模式：流式扫描目录，不限文件数量"""
+        directory = filedialog.askdirectory(title="选择包含扫描照片的文件夹")
+        if not directory:
+            return
 
         try:
-            with ThreadPoolExecutor(max_workers=4) as executor:
-                futures = []
-                for path in valid_files:
-                    futures.append(executor.submit(
-                        ImageProcessor.process_image,
-                        path,
-                        output_dir
-                    ))
-
-                results = []
-                for future in futures:
-                    try:
-                        results.extend(future.result())
-                        self.progress["value"] += 1
-                        self.root.update()
-                    except Exception as e:
-                        logging.error(str(e))
-
-            success = len(results)
-            self._show_results(success, [], results, output_dir)
-            self._open_output_dir(output_dir)
+            output_dir = self._prepare_output_dir()
+            logging.info(f"输出目录路径：{output_dir}")
         except Exception as e:
-            messagebox.showerror("严重错误", f"处理意外中断:\n{str(e)}")
-            logging.critical("处理中断", exc_info=True)
-        finally:
-            self.progress["value"] = 0
+            messagebox.showerror("错误", f"无法创建输出目录：{str(e)}")
+            return
+
+        self._init_progress_bar(1)
+        self._run_batch(iter_image_files(directory, skip_dirs=(output_dir,)), output_dir)
+
+    def _run_batch(self, paths: Iterable[str], output_dir: str, total: Optional[int] = None):
+        """在后台线程中把文件送入工作池，结果经队列回到界面线程"""
+        if self.batch_stats is not None:
+            messagebox.showwarning("提示", "已有任务正在处理，请等待完成或先停止。")
+            return
+
+        try:
+            runner = self._get_runner()
+            detection = self._get_detection()
+        except (ValueError, tk.TclError) as e:
+            messagebox.showwarning("提示", f"设置无效：{str(e)}")
+            return
+
+        # 清单总是记录新分割的页面；取消“跳过已分割”时只是不查询清单
+        manifest = SplitManifest(output_dir, skip_existing=self.skip_done_var.get())
+        # 耗时统计只在后台线程中累计，结束标记送达后界面线程才读取汇总
+        metrics = StageMetrics()
+
+        self.stop_event.clear()
+        self.batch_stats = {"total": total, "discovered": 0, "done": 0, "success": 0, "skipped": 0,
+                            "outputs": 0, "errors": [], "error_count": 0, "output_dir": output_dir,
+                            "metrics": metrics}
+        self._set_running(True)
+
+        def counted():
+            for path in paths:
+                self.batch_stats["discovered"] += 1
+                yield path
+
+        def worker():
+            try:
+                for result in runner.run(counted(), output_dir, self.stop_event.is_set, detection,
+                                         manifest, metrics):
+                    self.result_queue.put(result)
+            except Exception as e:
+                logging.critical("处理中断", exc_info=True)
+                self.result_queue.put(PageResult(None, [], f"处理意外中断：{str(e)}"))
+            finally:
+                self.result_queue.put(None)
+
+        Thread(target=worker, daemon=True).start()
+        self.root.after(POLL_INTERVAL_MS, self._poll_results)
+
+    def _poll_results(self):
+        """界面线程定时取回处理结果，更新进度"""
+        stats = self.batch_stats
+        finished = False
+        while True:
+            try:
+                result = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                finished = True
+                break
+            stats["done"] += 1 if result.path else 0
+            if result.error:
+                stats["error_count"] += 1
+                if len(stats["errors"]) < MAX_ERROR_DETAILS:
+                    name = os.path.basename(result.path) if result.path else "批处理"
+                    stats["errors"].append(f"{name}：{result.error}")
+            elif result.skipped:
+                stats["skipped"] += 1
+            else:
+                stats["success"] += 1
+                stats["outputs"] += len(result.outputs)
+
+        total = stats["total"] or max(stats["discovered"], 1)
+        self.progress["maximum"] = total
+        self.progress["value"] = stats["done"]
+        scanning = "" if stats["total"] or finished else "（扫描中）"
+        self.status_var.set(f"已处理 {stats['done']} / {stats['discovered']}{scanning}，"
+                            f"生成 {stats['outputs']} 张，跳过 {stats['skipped']}，失败 {stats['error_count']}")
+
+        if finished:
+            self._finish_batch()
+        else:
+            self.root.after(POLL_INTERVAL_MS, self._poll_results)
+
+    def _finish_batch(self):
+        """批处理结束：汇总结果并打开输出目录"""
+        stats, self.batch_stats = self.batch_stats, None
+        self._set_running(False)
+        self.progress["value"] = 0
+        errors = stats["errors"]
+        if stats["error_count"] > len(errors):
+            errors = errors + [f"……另有 {stats['error_count'] - len(errors)} 个错误，详见日志"]
+        timing = stats["metrics"].summary()
+        logging.info("各阶段耗时：" + "；".join(timing))
+        self._show_results(stats["success"], errors, stats["outputs"], stats["output_dir"], stats["skipped"],
+                           timing)
+        if stats["outputs"]:
+            self._open_output_dir(stats["output_dir"])
+
+    def _get_runner(self) -> BatchRunner:
+        """返回持久工作池，并行设置变化时重建"""
+        workers = self.workers_var.get()
+        if not 1 <= workers <= WORKER_COUNT:
+            raise ValueError(f"工作数应在 1-{WORKER_COUNT} 之间")
+        backend = next(key for key, label in BACKENDS.items() if label == self.backend_var.get())
+        if self.runner is None or (self.runner.workers, self.runner.backend) != (workers, backend):
+            if self.runner is not None:
+                self.runner.shutdown()
+            self.runner = BatchRunner(workers, backend)
+        return self.runner
+
+    def _get_detection(self) -> dict:
+        """界面上的照片筛选设置"""
+        max_count = self.max_count_var.get()
+        min_area = self.min_area_var.get()
+        if max_count < 1:
+            raise ValueError("每页最多照片数至少为 1")
+        if not 0 <= min_area < 100:
+            raise ValueError("最小面积应在 0-100% 之间")
+        return {"max_count": max_count, "min_area_ratio": min_area / 100}
+
+    def _set_running(self, running: bool):
+        """处理期间禁用开始按钮，启用停止按钮"""
+        state = tk.DISABLED if running else tk.NORMAL
+        self.process_btn.configure(state=state)
+        self.folder_btn.configure(state=state)
+        self.stop_btn.configure(state=tk.NORMAL if running else tk.DISABLED)
+
+    def _on_close(self):
+        """关闭窗口时停止提交并释放工作池"""
+        self.stop_event.set()
+        if self.runner is not None:
+            self.runner.shutdown()
+        self.root.destroy()
 
     def _prepare_output_dir(self) -> str:
         """准备输出目录"""
@@ -448,19 +1303,26 @@ class ImageProcessorApp:
         self.progress["maximum"] = total
         self.progress["value"] = 0
 
-    def _show_results(self, success: int, errors: List[str], outputs: List[str], output_dir: str):
-        """显示处理结果"""
+    def _show_results(self, success: int, errors: List[str], output_count: int, output_dir: str,
+                      skipped: int = 0, timing: Optional[List[str]] = None):
+        """显示处理结果；timing 为 StageMetrics.summary() 的各阶段耗时汇总"""
         msg = []
         if success > 0:
             msg.append(f"成功处理 {success} 张图片")
-            msg.append(f"生成文件数：{len(outputs)}")
+            msg.append(f"生成文件数：{output_count}")
+        if skipped > 0:
+            msg.append(f"已分割过、跳过 {skipped} 张图片")
+        if success > 0 or skipped > 0:
             msg.append(f"输出目录：{output_dir}")
+        if timing:
+            msg.append(f"\n各阶段耗时（明细见 {metrics_file_path}）：\n• " + "\n• ".join(timing))
         if errors:
             msg.append("\n错误列表：\n• " + "\n• ".join(errors))
 
-        title = "处理完成" if success > 0 else "处理失败"
+        ok = success > 0 or (skipped > 0 and not errors)
+        title = "处理完成" if ok else "处理失败"
         messagebox.showinfo(title, "\n".join(msg))
-        self._play_sound(success > 0)
+        self._play_sound(ok)
 
     def _play_sound(self, success: bool):
         """播放提示音"""
@@ -519,8 +1381,8 @@ class ImageProcessorApp:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     cv2.setUseOptimized(True)
-    cv2.setNumThreads(4)
     root = tk.Tk()
     app = ImageProcessorApp(root)
     root.mainloop()
\ No newline at end of file
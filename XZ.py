@@ -3,6 +3,8 @@ import time
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 from PIL import Image
+import numpy as np
+import io
 from datetime import datetime
 import sys
 import shutil
@@ -12,9 +14,25 @@ import requests
 import tempfile
 import subprocess
 import hashlib
-from threading import Thread
+import sqlite3
+import json
+import argparse
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from threading import Thread, Lock
 import logging
 
+# 可选编码器插件：旧版 Pillow 的 AVIF 需要 pillow-avif-plugin，JPEG XL 需要 pillow-jxl-plugin
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+try:
+    import pillow_jxl  # noqa: F401
+except ImportError:
+    pass
+
 # 设置日志
 log_file = "image_optimizer.log"
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', filename=log_file,
@@ -111,8 +129,814 @@ del %0
         sys.exit()
 
 
+def get_root_dir():
+    """获取程序根目录路径"""
+    return getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+
+
+# ===================== 目录扫描模块 =====================
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.avif', '.jxl')
+SCAN_QUEUE_SIZE = 256
+
+
+def scan_image_files(directory, skip_dirs=()):
+    """基于 os.scandir 的流式目录扫描，发现一个图片就立即产出一个路径"""
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in skip_dirs:
+                                pending.append(entry.path)
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.error(f"无法读取目录 {current}：{str(e)}")
+
+
+def iter_input_files(inputs, skip_dirs=()):
+    """展开输入：目录流式扫描其中的图片，文件原样产出"""
+    for path in inputs:
+        if os.path.isdir(path):
+            yield from scan_image_files(path, skip_dirs)
+        else:
+            yield path
+
+
+# ===================== 优化索引模块 =====================
+class OptimizedIndex:
+    """已优化文件索引（SQLite），按 路径+大小+修改时间 识别本工具产出的文件，可选内容哈希校验
+
+    输出到 CFOK 目录时同时记录源文件的 路径+大小+修改时间（+哈希），重跑时按源文件查找。
+    同时记录产出时的长边限制（0 为不限）和自适应目标（如 "target_size=102400"，固定质量为空），
+    与本次设置不同时视为未优化。
+    """
+
+    COMMIT_INTERVAL = 500
+    # 旧版索引没有的列，打开时补上；旧记录的 max_side / target 为 NULL，按不限、固定质量处理
+    ADDED_COLUMNS = (("source", "TEXT"), ("source_size", "INTEGER"),
+                     ("source_mtime_ns", "INTEGER"), ("source_digest", "TEXT"), ("max_side", "INTEGER"),
+                     ("target", "TEXT"))
+    SETTINGS_FILTER = "IFNULL(max_side, 0) = ? AND IFNULL(target, '') = ?"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS optimized (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            quality INTEGER NOT NULL,
+            digest TEXT,
+            updated_at TEXT NOT NULL
+        )""")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(optimized)")}
+        for name, kind in self.ADDED_COLUMNS:
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE optimized ADD COLUMN {name} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS optimized_source ON optimized (source)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    @staticmethod
+    def file_digest(path):
+        """计算文件内容的 SHA-1"""
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _unchanged(self, path, stat, size, mtime_ns, digest, use_hash, column, key_column):
+        """文件大小和修改时间与记录一致；修改时间变了（如同步工具重写）时用内容哈希确认并更新记录"""
+        if size != stat.st_size:
+            return False
+        if mtime_ns == stat.st_mtime_ns:
+            return True
+        if use_hash and digest and digest == self.file_digest(path):
+            with self._lock:
+                self._conn.execute(f"UPDATE optimized SET {column} = ? WHERE {key_column} = ?",
+                                   (stat.st_mtime_ns, self._key(path)))
+            return True
+        return False
+
+    def is_optimized(self, path, quality, use_hash=False, max_side=None, match_source=False, target=None):
+        """文件是否已由本工具以不低于当前压缩程度的质量、相同的长边限制和自适应目标产出过
+
+        match_source 为 True（输出到 CFOK 目录）时，产出文件仍然完好的未改动源文件也算已优化；
+        替换模式下源文件本身要被压缩，不能按源文件命中。
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        key = self._key(path)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT size, mtime_ns, quality, digest FROM optimized WHERE path = ? AND {self.SETTINGS_FILTER}",
+                (key, max_side or 0, target or "")
+            ).fetchone()
+            outputs = self._conn.execute(
+                "SELECT path, size, mtime_ns, quality, digest, source_size, source_mtime_ns, source_digest "
+                f"FROM optimized WHERE source = ? AND {self.SETTINGS_FILTER}", (key, max_side or 0, target or "")
+            ).fetchall() if match_source else []
+
+        if row is not None:
+            size, mtime_ns, recorded_quality, digest = row
+            if recorded_quality <= quality and self._unchanged(path, stat, size, mtime_ns, digest, use_hash,
+                                                               "mtime_ns", "path"):
+                return True
+
+        # 源文件：产出文件仍然完好且源文件没有改动才跳过
+        for output, size, mtime_ns, recorded_quality, digest, source_size, source_mtime_ns, source_digest in outputs:
+            if recorded_quality > quality:
+                continue
+            try:
+                output_stat = os.stat(output)
+            except OSError:
+                continue
+            if (self._unchanged(output, output_stat, size, mtime_ns, digest, use_hash, "mtime_ns", "path")
+                    and self._unchanged(path, stat, source_size, source_mtime_ns, source_digest, use_hash,
+                                        "source_mtime_ns", "source")):
+                return True
+        return False
+
+    def record(self, path, quality, use_hash=False, source=None, max_side=None, target=None):
+        """记录一个本工具产出的文件；source 为另存到其他路径时的源文件，max_side / target 为产出时的设置"""
+        stat = os.stat(path)
+        digest = self.file_digest(path) if use_hash else None
+        source_row = (None, None, None, None)
+        if source is not None and self._key(source) != self._key(path):
+            source_stat = os.stat(source)
+            source_row = (self._key(source), source_stat.st_size, source_stat.st_mtime_ns,
+                          self.file_digest(source) if use_hash else None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO optimized (path, size, mtime_ns, quality, digest, updated_at, "
+                "source, source_size, source_mtime_ns, source_digest, max_side, target) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(path), stat.st_size, stat.st_mtime_ns, quality, digest,
+                 datetime.now().strftime('%Y-%m-%d %H:%M:%S')) + source_row + (max_side or 0, target or "")
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_INTERVAL:
+                self._conn.commit()
+                self._pending = 0
+
+    def has_other_source(self, path, source):
+        """产出文件 path 是否记录为由 source 以外的源文件产出"""
+        with self._lock:
+            row = self._conn.execute("SELECT source FROM optimized WHERE path = ?", (self._key(path),)).fetchone()
+        return row is not None and row[0] is not None and row[0] != self._key(source)
+
+    def move(self, src_path, dst_path):
+        """文件被移动（如 CFOK 中的产出文件替换原图）后同步更新索引中的路径，不再按源文件查找"""
+        with self._lock:
+            self._conn.execute("DELETE FROM optimized WHERE path = ?", (self._key(dst_path),))
+            self._conn.execute("UPDATE optimized SET path = ?, source = NULL WHERE path = ?",
+                               (self._key(dst_path), self._key(src_path)))
+
+    def flush(self):
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+
+# ===================== 编码器模块 =====================
+class Codec:
+    """输出编码器基类：子类声明 Pillow 格式、扩展名、压缩力度范围和编码参数
+
+    effort 越大压缩越慢、体积越小；不支持力度调节的编码器 effort_range 为 None。
+    lossless 编码器忽略质量参数，由 compress_image 按图自动选用，不出现在格式选择中。
+    """
+    name = None
+    label = None
+    format = None
+    extensions = ()
+    effort_range = None
+    default_effort = None
+    lossless = False
+
+    def __init__(self, effort=None):
+        self.effort = self.default_effort if effort is None else effort
+        if self.effort_range and not self.effort_range[0] <= self.effort <= self.effort_range[1]:
+            raise ValueError(f"{self.label} 压缩力度必须在 {self.effort_range[0]}-{self.effort_range[1]} 之间")
+
+    @classmethod
+    def available(cls):
+        Image.init()
+        return cls.format in Image.SAVE
+
+    def save_options(self, quality, progressive=True):
+        """传给 Image.save 的编码参数；默认只传质量，子类按格式补充"""
+        return {"quality": quality}
+
+    def encode(self, img, quality, progressive=True):
+        """编码到内存缓冲区，不产生临时文件"""
+        buffer = io.BytesIO()
+        img.save(buffer, self.format, **self.save_options(quality, progressive))
+        return buffer
+
+
+class JpegCodec(Codec):
+    """优化哈夫曼表 + 渐进式 JPEG"""
+    name = "jpeg"
+    label = "JPEG"
+    format = "JPEG"
+    extensions = (".jpg", ".jpeg")
+
+    def save_options(self, quality, progressive=True):
+        return {"quality": quality, "optimize": True, "progressive": progressive}
+
+
+class WebpCodec(Codec):
+    name = "webp"
+    label = "WebP"
+    format = "WEBP"
+    extensions = (".webp",)
+    effort_range = (0, 6)
+    default_effort = 4
+
+    def save_options(self, quality, progressive=True):
+        return {"quality": quality, "method": self.effort}
+
+
+class AvifCodec(Codec):
+    name = "avif"
+    label = "AVIF"
+    format = "AVIF"
+    extensions = (".avif",)
+    effort_range = (0, 10)
+    default_effort = 4
+
+    def save_options(self, quality, progressive=True):
+        # AVIF 的 speed 与力度相反：0 最慢最小，10 最快
+        return {"quality": quality, "speed": 10 - self.effort}
+
+
+class JxlCodec(Codec):
+    name = "jxl"
+    label = "JPEG XL"
+    format = "JXL"
+    extensions = (".jxl",)
+    effort_range = (1, 9)
+    default_effort = 7
+
+    def save_options(self, quality, progressive=True):
+        return {"quality": quality, "effort": self.effort, "lossless_jpeg": False}
+
+
+class PngCodec(Codec):
+    """无损 PNG：颜色数不超过256时转为精确调色板，搜索 zlib 策略，去除文本/EXIF 等元数据"""
+    name = "png"
+    label = "PNG"
+    format = "PNG"
+    extensions = (".png",)
+    lossless = True
+    # zlib 策略：默认、FILTERED、RLE；行过滤器由 Pillow 按行自适应选择
+    ZLIB_STRATEGIES = (0, 1, 3)
+
+    @staticmethod
+    def has_alpha(img):
+        if "transparency" in img.info:
+            return True
+        if img.mode in ("RGBA", "LA", "PA"):
+            return img.getchannel("A").getextrema()[0] < 255
+        return False
+
+    @classmethod
+    def prefers_lossless(cls, img):
+        """带透明通道或颜色数不超过256的图（截图、图标、平面色块）只走无损路径"""
+        return cls.has_alpha(img) or img.mode in ("1", "P") or img.getcolors(256) is not None
+
+    @staticmethod
+    def to_palette(img):
+        """颜色数不超过256的 RGB/RGBA 图转为逐像素一致的调色板图，否则原样返回；RGB 的 tRNS 透明色一并保留"""
+        if img.mode not in ("RGB", "RGBA") or img.getcolors(256) is None:
+            return img
+        pixels = np.asarray(img, dtype=np.uint32)
+        keys = pixels[..., 0]
+        for channel in range(1, pixels.shape[2]):
+            keys = (keys << 8) | pixels[..., channel]
+        palette, indices = np.unique(keys.ravel(), return_inverse=True)
+        entries = np.stack([(palette >> (8 * shift)) & 255
+                            for shift in reversed(range(pixels.shape[2]))], axis=1)
+        paletted = Image.fromarray(indices.reshape(keys.shape).astype(np.uint8), "P")
+        paletted.putpalette(entries.astype(np.uint8).tobytes(), rawmode=img.mode)
+        transparency = img.info.get("transparency")
+        if img.mode == "RGB" and isinstance(transparency, tuple):
+            # tRNS 色键：换成透明色在调色板中的序号
+            key = (transparency[0] << 16) | (transparency[1] << 8) | transparency[2]
+            found = int(np.searchsorted(palette, key))
+            if found < len(palette) and palette[found] == key:
+                paletted.info["transparency"] = found
+        return paletted
+
+    def encode(self, img, quality=None, progressive=True):
+        source = self.to_palette(img)
+        params = {"optimize": True}
+        if img.info.get("icc_profile"):
+            # 保留色彩配置文件，保证显示效果不变
+            params["icc_profile"] = img.info["icc_profile"]
+        best = None
+        for strategy in self.ZLIB_STRATEGIES:
+            buffer = io.BytesIO()
+            source.save(buffer, self.format, compress_type=strategy, **params)
+            if best is None or buffer.getbuffer().nbytes < best.getbuffer().nbytes:
+                best = buffer
+        return best
+
+
+CODECS = {codec.name: codec for codec in (JpegCodec, WebpCodec, AvifCodec, JxlCodec, PngCodec)}
+LOSSY_CODECS = [name for name, codec in CODECS.items() if not codec.lossless]
+
+
+def make_codecs(names=None, efforts=None):
+    """按名称创建编码器列表，efforts 为 {名称: 力度}；不可用的编码器抛出 ValueError"""
+    efforts = efforts or {}
+    codecs = []
+    for name in names or ("jpeg",):
+        codec_class = CODECS.get(name)
+        if codec_class is None or codec_class.lossless:
+            raise ValueError(f"未知的输出格式：{name}")
+        if not codec_class.available():
+            raise ValueError(f"当前环境不支持 {codec_class.label} 编码")
+        codecs.append(codec_class(efforts.get(name)))
+    return codecs
+
+
+# ===================== 自适应质量模块 =====================
+QUALITY_SEARCH_MIN = 10
+QUALITY_SEARCH_MAX = 95
+METRIC_MAX_SIDE = 512
+SSIM_WINDOW = 7
+
+
+def metric_plane(img):
+    """质量评估用的灰度缩小图"""
+    gray = img.convert("L")
+    gray.thumbnail((METRIC_MAX_SIDE, METRIC_MAX_SIDE))
+    return np.asarray(gray, dtype=np.float64)
+
+
+def compute_psnr(reference, candidate):
+    mse = np.mean((reference - candidate) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def compute_ssim(reference, candidate):
+    """均值窗口 SSIM，用积分图计算局部统计量"""
+    window = max(1, min(SSIM_WINDOW, *reference.shape))
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    def box_mean(x):
+        s = np.pad(x, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+        return (s[window:, window:] - s[:-window, window:]
+                - s[window:, :-window] + s[:-window, :-window]) / (window * window)
+
+    mu_x = box_mean(reference)
+    mu_y = box_mean(candidate)
+    sigma_xx = box_mean(reference * reference) - mu_x ** 2
+    sigma_yy = box_mean(candidate * candidate) - mu_y ** 2
+    sigma_xy = box_mean(reference * candidate) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / \
+               ((mu_x ** 2 + mu_y ** 2 + c1) * (sigma_xx + sigma_yy + c2))
+    return float(ssim_map.mean())
+
+
+def decode_metric_plane(buffer):
+    buffer.seek(0)
+    with Image.open(buffer) as decoded:
+        return metric_plane(decoded)
+
+
+def search_quality(img, target_size=None, min_ssim=None, min_psnr=None, progressive=True, codec=None):
+    """二分查找每张图的编码质量（默认JPEG），返回 (质量, 编码结果缓冲区)
+
+    target_size：不超过该字节数的最高质量；min_ssim / min_psnr：满足感知质量下限的最低质量。
+    """
+    codec = codec or JpegCodec()
+    lo, hi = QUALITY_SEARCH_MIN, QUALITY_SEARCH_MAX
+    best = None
+    reference = metric_plane(img) if target_size is None else None
+
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        buffer = codec.encode(img, mid, progressive)
+        if target_size is not None:
+            if buffer.getbuffer().nbytes <= target_size:
+                best = (mid, buffer)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        else:
+            candidate = decode_metric_plane(buffer)
+            if min_ssim is not None:
+                passed = compute_ssim(reference, candidate) >= min_ssim
+            else:
+                passed = compute_psnr(reference, candidate) >= min_psnr
+            if passed:
+                best = (mid, buffer)
+                hi = mid - 1
+            else:
+                lo = mid + 1
+
+    if best is None:
+        # 目标无法达到：体积目标取最低质量，感知目标取最高质量
+        quality = QUALITY_SEARCH_MIN if target_size is not None else QUALITY_SEARCH_MAX
+        best = (quality, codec.encode(img, quality, progressive))
+    return best
+
+
+# ===================== 压缩引擎模块 =====================
+def load_image(src_path, max_side=None):
+    """解码图片并保留色彩模式，返回 (图像, 源格式)
+
+    指定 max_side 时先用 JPEG draft 模式和 reduce() 降低解码分辨率再精确缩放。
+    """
+    with Image.open(src_path) as img:
+        source_format = img.format
+        if not max_side or max(img.size) <= max_side:
+            img.load()
+            return img, source_format
+
+        scale = max_side / max(img.size)
+        target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        if source_format == "JPEG":
+            # DCT 域缩放：按 1/2、1/4、1/8 解码，结果不小于目标尺寸
+            img.draft(img.mode, target)
+        if img.mode in ("1", "P", "PA"):
+            image = img.convert("RGBA" if PngCodec.has_alpha(img) else "RGB")
+        else:
+            image = img.copy()
+
+    factor = min(image.width // target[0], image.height // target[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    if image.size != target:
+        image = image.resize(target, Image.LANCZOS)
+    return image, source_format
+
+
+def compress_image(src_path, dst_path, quality, progressive=True,
+                   target_size=None, min_ssim=None, min_psnr=None, max_side=None, codecs=None,
+                   png_lossless=True):
+    """单文件压缩（在子进程中执行），返回 (原始大小, 优化后大小, 实际质量, 编码器名)
+
+    指定 target_size / min_ssim / min_psnr 之一时按图自适应搜索质量，忽略 quality；
+    指定 max_side 时把长边缩小到不超过该像素数。codecs 有多个候选时逐一编码，
+    保留体积最小的结果（target_size 模式下保留不超过目标且 SSIM 最高的结果）。
+    png_lossless 时 PNG 源图加入无损候选；带透明或不超过256色的 PNG 只做无损优化，
+    无损结果不比原图小时原样保留。无损结果的质量记为 None。
+    """
+    codecs = list(codecs or [JpegCodec()])
+    original_size = os.path.getsize(src_path)
+    img, source_format = load_image(src_path, max_side)
+    if png_lossless and source_format == "PNG":
+        codecs = [PngCodec()] if PngCodec.prefers_lossless(img) else codecs + [PngCodec()]
+
+    lossy = [codec for codec in codecs if not codec.lossless]
+    rgb = img.convert("RGB") if lossy and img.mode != "RGB" else img
+    adaptive = target_size is not None or min_ssim is not None or min_psnr is not None
+    reference = metric_plane(rgb) if target_size is not None and len(codecs) > 1 else None
+
+    best = None
+    for codec in codecs:
+        if codec.lossless:
+            used_quality, buffer = None, codec.encode(img)
+        elif adaptive:
+            used_quality, buffer = search_quality(rgb, target_size, min_ssim, min_psnr, progressive, codec)
+        else:
+            used_quality, buffer = quality, codec.encode(rgb, quality, progressive)
+        size = buffer.getbuffer().nbytes
+        if reference is not None:
+            similarity = 1.0 if codec.lossless else compute_ssim(reference, decode_metric_plane(buffer))
+            score = (size <= target_size, similarity)
+        else:
+            score = -size
+        if best is None or score > best[0]:
+            best = (score, codec, used_quality, buffer)
+
+    _, codec, used_quality, buffer = best
+    if codec.lossless and max_side is None and buffer.getbuffer().nbytes >= original_size:
+        shutil.copyfile(src_path, dst_path)
+        return original_size, original_size, used_quality, codec.name
+    with open(dst_path, "wb") as f:
+        f.write(buffer.getbuffer())
+    return original_size, buffer.getbuffer().nbytes, used_quality, codec.name
+
+
+class CompressionEngine:
+    """多进程压缩引擎：把每个JPEG编码分发到进程池，结果通过队列回传"""
+
+    def __init__(self, workers=None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.results = queue.Queue()
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def submit(self, key, src_path, dst_path, quality, progressive=True, **options):
+        """提交一个压缩任务，key 用于在结果中标识文件（如列表行号）"""
+        self.start()
+        future = self._executor.submit(compress_image, src_path, dst_path, quality, progressive, **options)
+        future.add_done_callback(lambda f: self._collect(f, key, src_path, dst_path))
+        return future
+
+    def _collect(self, future, key, src_path, dst_path):
+        result = {"key": key, "src": src_path, "dst": dst_path,
+                  "original_size": 0, "optimized_size": 0, "quality": None, "codec": None, "error": None}
+        try:
+            (result["original_size"], result["optimized_size"],
+             result["quality"], result["codec"]) = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            result["error"] = str(e)
+        self.results.put(result)
+
+    def drain(self):
+        """非阻塞地取出当前所有已完成的结果"""
+        while True:
+            try:
+                yield self.results.get_nowait()
+            except queue.Empty:
+                return
+
+    def shutdown(self, cancel=False):
+        """关闭进程池；cancel 时丢弃排队任务，只等待正在执行的任务结束"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=cancel)
+            self._executor = None
+
+
+# ===================== 批处理接口 =====================
+DEFAULT_OUTPUT_FOLDER = "CFOK"
+OUTPUT_MODES = ("cfok", "replace")
+TEMP_SUFFIX = ".cfok-tmp"
+CLI_OUTPUT_FILE = "cli_output.jsonl"  # 无控制台的打包版本没有标准输出时，命令行进度写到程序目录下的这个文件
+
+
+def remove_temp_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def optimize_files(inputs, quality=60, output_mode="cfok", workers=None, dry_run=False,
+                   index=None, use_hash=False, output_folder=DEFAULT_OUTPUT_FOLDER, should_stop=None,
+                   target_size=None, min_ssim=None, min_psnr=None, max_side=None, codecs=None,
+                   png_lossless=True):
+    """无界面的批量压缩接口，按完成顺序逐个产出每个文件的处理结果
+
+    inputs 可以混合文件和目录；output_mode 为 "cfok" 时输出到各目录下的 CFOK 文件夹，
+    为 "replace" 时先编码到同目录的临时文件，再用 os.replace 原子替换原文件。
+    target_size（字节）/ min_ssim / min_psnr 启用逐图自适应质量，max_side 限制输出长边像素数，
+    codecs 为候选编码器列表（见 make_codecs），每个文件保留最优的一种；
+    png_lossless 时 PNG 源图自动走无损优化路径（见 compress_image）。
+    结果字典的 status 为 optimized / skipped / dry_run / error。
+    """
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"未知的输出模式：{output_mode}")
+    should_stop = should_stop or (lambda: False)
+    search = {name: value for name, value in (("target_size", target_size),
+                                               ("min_ssim", min_ssim),
+                                               ("min_psnr", min_psnr)) if value is not None}
+    if len(search) > 1:
+        raise ValueError("target_size / min_ssim / min_psnr 只能指定一个")
+    codecs = codecs or [JpegCodec()]
+    options = dict(search, codecs=codecs, png_lossless=png_lossless)
+    if max_side:
+        options["max_side"] = max_side
+    # 自适应模式下质量上限为 QUALITY_SEARCH_MAX，以此判断是否已优化；目标和指标另记入索引
+    check_quality = QUALITY_SEARCH_MAX if search else quality
+    target = "".join(f"{name}={value}" for name, value in search.items())
+
+    engine = None if dry_run else CompressionEngine(workers)
+    window = engine.workers * 4 if engine else 0
+    pending = {}  # key -> 在途任务的临时输出路径
+    claimed = {}  # 本次已写出的输出路径 -> 源文件，防止 a.jpg 和 a.png 输出到同一个 a.webp
+
+    def next_result():
+        while not should_stop():
+            try:
+                return engine.results.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return None
+
+    def final_path(src_path, temp_path, codec):
+        """输出文件路径，扩展名总与编码格式一致；会覆盖其他源文件或其产出时抛出 FileExistsError"""
+        stem = os.path.splitext(os.path.basename(src_path))[0]
+        if output_mode == "cfok":
+            path = os.path.join(os.path.dirname(temp_path), stem + codec.extensions[0])
+            if index is not None and os.path.exists(path) and index.has_other_source(path, src_path):
+                raise FileExistsError(f"{path} 是其他同名文件的压缩结果，已跳过")
+        elif src_path.lower().endswith(codec.extensions):
+            path = src_path
+        else:
+            # 格式改变时换扩展名；同名文件已存在则跳过，不覆盖其他文件，也不用原扩展名保存新格式
+            path = os.path.join(os.path.dirname(src_path), stem + codec.extensions[0])
+            if os.path.exists(path):
+                raise FileExistsError(f"{path} 已存在，未替换原文件")
+        owner = claimed.get(os.path.normcase(os.path.abspath(path)), src_path)
+        if owner != src_path:
+            raise FileExistsError(f"{os.path.basename(owner)} 已输出到 {path}，已跳过")
+        return path
+
+    def finish(raw):
+        pending.pop(raw["key"], None)
+        result = dict(raw, status="optimized")
+        try:
+            if raw["error"]:
+                result["status"] = "error"
+                remove_temp_file(raw["dst"])
+                return result
+            dst_path = final_path(raw["src"], raw["dst"], CODECS[raw["codec"]])
+            if output_mode == "replace":
+                try:
+                    shutil.copymode(raw["src"], raw["dst"])
+                except OSError:
+                    pass
+            # 原子替换：任何时刻磁盘上都有完整的原图或新图
+            os.replace(raw["dst"], dst_path)
+            claimed[os.path.normcase(os.path.abspath(dst_path))] = raw["src"]
+            if output_mode == "replace" and dst_path != raw["src"]:
+                os.remove(raw["src"])
+            result["dst"] = dst_path
+            if index is not None:
+                # 无损结果记为质量 0：任何质量设置下都不必再压缩
+                # cfok 模式下原图不动，同时记下源文件，重跑时按源文件命中
+                index.record(result["dst"], raw["quality"] if raw["quality"] is not None else 0, use_hash,
+                             source=raw["src"] if output_mode == "cfok" else None, max_side=max_side,
+                             target=target)
+        except Exception as e:
+            remove_temp_file(raw["dst"])
+            result.update(status="error", error=str(e))
+        return result
+
+    try:
+        for key, src_path in enumerate(iter_input_files(inputs, skip_dirs=(output_folder,))):
+            if should_stop():
+                break
+            result = {"key": key, "src": src_path, "dst": None, "status": None,
+                      "original_size": 0, "optimized_size": 0, "quality": None, "codec": None, "error": None}
+            try:
+                if index is not None and index.is_optimized(src_path, check_quality, use_hash, max_side,
+                                                             match_source=output_mode == "cfok", target=target):
+                    result["status"] = "skipped"
+                    yield result
+                    continue
+
+                file_dir, file_name = os.path.split(src_path)
+                output_dir = file_dir if output_mode == "replace" else os.path.join(file_dir, output_folder)
+                temp_path = os.path.join(output_dir, f".{file_name}{TEMP_SUFFIX}")
+                if dry_run:
+                    result.update(status="dry_run", original_size=os.path.getsize(src_path),
+                                  dst=final_path(src_path, temp_path, codecs[0]), codec=codecs[0].name)
+                    yield result
+                    continue
+
+                os.makedirs(output_dir, exist_ok=True)
+                engine.submit(key, src_path, temp_path, quality, **options)
+                pending[key] = temp_path
+            except Exception as e:
+                result.update(status="error", error=str(e))
+                yield result
+                continue
+
+            # 控制在途任务数量，避免流式输入时任务堆积
+            while len(pending) >= window:
+                raw = next_result()
+                if raw is None:
+                    break
+                yield finish(raw)
+            for raw in engine.drain():
+                yield finish(raw)
+
+        while pending:
+            raw = next_result()
+            if raw is None:
+                break
+            yield finish(raw)
+    finally:
+        if engine is not None:
+            engine.shutdown(cancel=should_stop())
+        # 取消或中断时清理未完成的临时文件，原图保持不变
+        for temp_path in pending.values():
+            remove_temp_file(temp_path)
+
+
+def cli_main(argv=None):
+    """命令行入口：无界面运行压缩，以 JSON Lines 输出进度"""
+    parser = argparse.ArgumentParser(description="尘飞图片压缩工具（命令行模式）")
+    parser.add_argument("inputs", nargs="+", help="图片文件或目录（目录会递归扫描）")
+    parser.add_argument("-q", "--quality", type=int, default=60, help="压缩质量 1-100，默认 60")
+    parser.add_argument("-m", "--mode", choices=OUTPUT_MODES, default="cfok",
+                        help="cfok：输出到 CFOK 目录；replace：替换原文件")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--target-size", type=float, default=None, help="逐图自适应：目标文件大小（KB）")
+    target.add_argument("--min-ssim", type=float, default=None, help="逐图自适应：最低 SSIM（如 0.95）")
+    target.add_argument("--min-psnr", type=float, default=None, help="逐图自适应：最低 PSNR（dB）")
+    parser.add_argument("--max-side", type=int, default=None, help="输出长边最大像素数（解码时按比例降采样）")
+    parser.add_argument("-c", "--codec", action="append", choices=LOSSY_CODECS,
+                        help="输出格式，可重复指定多个，每个文件保留最优的一种；默认 jpeg")
+    parser.add_argument("--effort", action="append", default=[], metavar="格式=力度",
+                        help="编码器压缩力度，如 webp=6、avif=8、jxl=9")
+    parser.add_argument("--no-png-lossless", action="store_true",
+                        help="PNG 源图不走无损优化，按所选格式有损压缩")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行进程数，默认等于 CPU 核数")
+    parser.add_argument("--dry-run", action="store_true", help="只列出将要处理的文件，不写入任何内容")
+    parser.add_argument("--hash", action="store_true", help="索引比对时启用内容哈希校验")
+    parser.add_argument("--index", default=os.path.join(get_root_dir(), "optimized_index.db"),
+                        help="已优化文件索引路径")
+    parser.add_argument("--no-index", action="store_true", help="不使用已优化文件索引")
+    parser.add_argument("-o", "--output", default=None,
+                        help=f"JSON Lines 进度追加写入的文件，默认标准输出（没有标准输出时写入 {CLI_OUTPUT_FILE}）")
+    args = parser.parse_args(argv)
+
+    try:
+        efforts = {}
+        for item in args.effort:
+            name, _, level = item.partition("=")
+            efforts[name.strip()] = int(level)
+        codecs = make_codecs(args.codec, efforts)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # 打包时使用 --noconsole，exe 中 sys.stdout 为 None
+    if args.output is None and sys.stdout is not None:
+        stream = sys.stdout
+    else:
+        stream = open(args.output or os.path.join(get_root_dir(), CLI_OUTPUT_FILE), "a", encoding="utf-8")
+
+    def emit(record):
+        stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        stream.flush()
+
+    try:
+        index = None if args.no_index else OptimizedIndex(args.index)
+        counts = {"optimized": 0, "skipped": 0, "dry_run": 0, "error": 0}
+        by_codec = {}
+        original_bytes = optimized_bytes = 0
+        start_time = time.time()
+        emit({"event": "start", "quality": args.quality, "mode": args.mode,
+              "workers": args.workers or os.cpu_count(), "dry_run": args.dry_run,
+              "codecs": {codec.name: codec.effort for codec in codecs}})
+        try:
+            target_size = int(args.target_size * 1024) if args.target_size is not None else None
+            for result in optimize_files(args.inputs, args.quality, args.mode, args.workers,
+                                         args.dry_run, index, args.hash,
+                                         target_size=target_size, min_ssim=args.min_ssim,
+                                         min_psnr=args.min_psnr, max_side=args.max_side, codecs=codecs,
+                                         png_lossless=not args.no_png_lossless):
+                counts[result["status"]] += 1
+                if result["status"] == "optimized":
+                    original_bytes += result["original_size"]
+                    optimized_bytes += result["optimized_size"]
+                    stats = by_codec.setdefault(result["codec"], {"files": 0, "original_bytes": 0,
+                                                                  "optimized_bytes": 0})
+                    stats["files"] += 1
+                    stats["original_bytes"] += result["original_size"]
+                    stats["optimized_bytes"] += result["optimized_size"]
+                emit(dict(result, event="file", elapsed=round(time.time() - start_time, 3)))
+        finally:
+            if index is not None:
+                index.flush()
+
+        elapsed = time.time() - start_time
+        emit({"event": "summary", **counts,
+              "original_bytes": original_bytes,
+              "optimized_bytes": optimized_bytes,
+              "saved_bytes": original_bytes - optimized_bytes,
+              "by_codec": by_codec,
+              "elapsed": round(elapsed, 3),
+              "files_per_sec": round(counts["optimized"] / elapsed, 2) if elapsed > 0 else 0.0})
+        return 1 if counts["error"] else 0
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
 # ===================== 主程序模块 =====================
 class ImageOptimizer:
+    SEARCH_MODES = ("固定质量", "目标大小(KB)", "最低SSIM", "最低PSNR(dB)")
+
     def __init__(self, root):
         self.root = root
         self.root.title("尘飞图片压缩工具1.1")
@@ -124,9 +948,18 @@ class ImageOptimizer:
         self.report_folder = "TJSJ"
         self.total_saved_file = "total_saved.txt"
         self.usage_count_file = "usage_count.txt"
+        self.index_file = "optimized_index.db"
         self.start_time = None
         self.time_records = []
         self.processing = False
+        self.result_queue = None
+        self.scan_queue = None
+        self.scan_done = False
+        self.discovered_count = 0
+        self.index_hits = 0
+        self.index_misses = 0
+        self.codec_stats = {}
+        self.compress_options = {}
 
         # 自动更新组件
         self.current_version = "1.1"
@@ -138,6 +971,7 @@ class ImageOptimizer:
         # 加载历史数据
         self.total_saved_gb = self.load_total_saved()
         self.usage_count = self.load_usage_count()
+        self.index = OptimizedIndex(os.path.join(self.get_root_dir(), self.index_file))
 
         # 启动更新检查
         self.check_for_update()
@@ -148,8 +982,7 @@ class ImageOptimizer:
     # ===================== 数据持久化方法 =====================
     def get_root_dir(self):
         """获取程序根目录路径"""
-        base_dir = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
-        return base_dir
+        return get_root_dir()
 
     def load_total_saved(self):
         """加载历史累计节省空间"""
@@ -234,7 +1067,9 @@ class ImageOptimizer:
 
 【注意事项】
 - 在执行替换原文件或批量处理操作前，请务必对重要数据进行备份。
-- 非JPG格式的图片文件在优化过程中会被转换为JPG格式。
+- 图片会被转换为所选输出格式（默认JPG），勾选多个格式时每张图保留体积最小的一种。
+- 勾选“PNG无损优化”时，带透明或颜色较少的PNG（截图、图标）保持PNG格式无损压缩。
+- 已由本工具优化过的文件会被自动跳过，不会重复压缩。
 - 替换原文件和批量处理操作会永久删除原始图片文件，请谨慎操作。
 - 自动更新功能需要网络连接，请确保有网络的情况下运行程序以检查更新。
 - 统计文件在程序目录里查看 开发维护：ChenFei。"""
@@ -290,6 +1125,77 @@ class ImageOptimizer:
         )
         self.quality_spin.pack(side=tk.LEFT, padx=5)
 
+        ttk.Label(option_frame, text="并行进程数:").pack(side=tk.LEFT, padx=5)
+        self.workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        self.workers_spin = ttk.Spinbox(
+            option_frame,
+            from_=1,
+            to=max(64, os.cpu_count() or 1),
+            textvariable=self.workers_var,
+            width=5
+        )
+        self.workers_spin.pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(option_frame, text="最大边长(px，0不缩放):").pack(side=tk.LEFT, padx=5)
+        self.max_side_var = tk.IntVar(value=0)
+        ttk.Spinbox(
+            option_frame,
+            from_=0,
+            to=20000,
+            increment=256,
+            textvariable=self.max_side_var,
+            width=6
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.hash_check_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="内容哈希校验",
+                        variable=self.hash_check_var).pack(side=tk.LEFT, padx=5)
+
+        # 自适应质量选项
+        search_frame = ttk.LabelFrame(parent, text="自适应质量")
+        search_frame.pack(pady=5, fill=tk.X, padx=10)
+
+        ttk.Label(search_frame, text="质量模式:").pack(side=tk.LEFT, padx=5)
+        self.search_mode_var = tk.StringVar(value=self.SEARCH_MODES[0])
+        ttk.Combobox(
+            search_frame,
+            textvariable=self.search_mode_var,
+            values=self.SEARCH_MODES,
+            state="readonly",
+            width=14
+        ).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(search_frame, text="目标值:").pack(side=tk.LEFT, padx=5)
+        self.search_value_var = tk.StringVar(value="")
+        ttk.Entry(search_frame, textvariable=self.search_value_var, width=10).pack(side=tk.LEFT, padx=5)
+
+        # 输出格式选项：勾选多个时每张图保留最优的一种
+        codec_frame = ttk.LabelFrame(parent, text="输出格式（力度越大越慢、越小）")
+        codec_frame.pack(pady=5, fill=tk.X, padx=10)
+
+        self.codec_vars = {}
+        self.effort_vars = {}
+        for name in LOSSY_CODECS:
+            codec_class = CODECS[name]
+            available = codec_class.available()
+            self.codec_vars[name] = tk.BooleanVar(value=(name == "jpeg"))
+            ttk.Checkbutton(codec_frame, text=codec_class.label, variable=self.codec_vars[name],
+                            state=tk.NORMAL if available else tk.DISABLED).pack(side=tk.LEFT, padx=5)
+            if codec_class.effort_range:
+                self.effort_vars[name] = tk.IntVar(value=codec_class.default_effort)
+                ttk.Spinbox(
+                    codec_frame,
+                    from_=codec_class.effort_range[0],
+                    to=codec_class.effort_range[1],
+                    textvariable=self.effort_vars[name],
+                    width=3,
+                    state=tk.NORMAL if available else tk.DISABLED
+                ).pack(side=tk.LEFT)
+
+        self.png_lossless_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(codec_frame, text="PNG无损优化",
+                        variable=self.png_lossless_var).pack(side=tk.LEFT, padx=10)
+
         # 操作按钮框架
         btn_frame = ttk.Frame(parent)
         btn_frame.pack(pady=10)
@@ -307,7 +1213,7 @@ class ImageOptimizer:
     def select_files(self):
         files = filedialog.askopenfilenames(
             title="选择图片文件",
-            filetypes=(("图片文件", "*.jpg;*.jpeg;*.png;*.bmp"), ("所有文件", "*.*"))
+            filetypes=(("图片文件", "*.jpg;*.jpeg;*.png;*.bmp;*.webp;*.avif;*.jxl"), ("所有文件", "*.*"))
         )
         if files:
             self.selected_files.extend(files)
@@ -335,42 +1241,106 @@ class ImageOptimizer:
 
 【危险操作须知】
 1. 将会永久删除所有原始图片文件
-2. 所有BMP/PNG文件将被转换为JPG格式
-3. 原目录结构中的CFOK文件夹将被清除
+2. 所有图片将被转换为所选输出格式（默认JPG）
+3. 压缩结果直接原子替换原文件，不生成CFOK目录
 4. 此操作不可撤销，请务必提前备份！"""
         if not messagebox.askyesno("高危操作确认", warning_msg, icon='warning'):
             return
 
-        directory = filedialog.askdirectory(title="选择要处理的根目录")
-        if not directory:
+        try:
+            self.compress_options = self.get_compress_options()
+        except ValueError as e:
+            messagebox.showwarning("警告", str(e))
             return
 
-        all_files = []
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if file.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-                    all_files.append(os.path.join(root, file))
-
-        if not all_files:
-            messagebox.showinfo("提示", "所选目录中没有找到图片文件")
+        directory = filedialog.askdirectory(title="选择要处理的根目录")
+        if not directory:
             return
 
-        confirm_msg = f"共发现 {len(all_files)} 个图片文件，是否开始批量处理？"
-        if not messagebox.askyesno("确认操作", confirm_msg):
+        if not messagebox.askyesno("确认操作", f"将边扫描边处理目录：{directory}\n是否开始批量处理？"):
             return
 
         self.disable_buttons()
         self.processing = True
         self.start_time = time.time()
-        self.show_batch_progress(len(all_files))
-        Thread(target=self.process_batch_files, args=(all_files, directory)).start()
+        self.scan_queue = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+        self.scan_done = False
+        self.discovered_count = 0
+        self.index_hits = 0
+        self.index_misses = 0
+        self.codec_stats = {}
+        self.show_batch_progress()
+        Thread(target=self.scan_directory, args=(directory,), daemon=True).start()
+        Thread(target=self.process_batch_files, args=(self.iter_scanned_files(), directory)).start()
+
+    def scan_directory(self, directory):
+        """生产者：流式扫描目录，把图片路径放入有界队列"""
+        try:
+            for path in scan_image_files(directory, skip_dirs=(self.output_folder,)):
+                while self.processing:
+                    try:
+                        self.scan_queue.put(path, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if not self.processing:
+                    break
+                self.discovered_count += 1
+        finally:
+            self.scan_done = True
+
+    def iter_scanned_files(self):
+        """消费者：从有界队列中逐个取出待处理文件，扫描结束且队列清空后停止"""
+        while self.processing:
+            try:
+                yield self.scan_queue.get(timeout=0.2)
+            except queue.Empty:
+                if self.scan_done and self.scan_queue.empty():
+                    return
+
+    def get_compress_options(self):
+        """读取最大边长、输出格式和自适应质量设置，返回传给 optimize_files 的参数"""
+        options = {}
+        try:
+            max_side = int(self.max_side_var.get())
+        except (tk.TclError, ValueError):
+            raise ValueError("最大边长必须是整数（0 表示不缩放）")
+        if max_side > 0:
+            options["max_side"] = max_side
+
+        names = [name for name, var in self.codec_vars.items() if var.get()]
+        if not names:
+            raise ValueError("请至少选择一种输出格式")
+        try:
+            efforts = {name: int(var.get()) for name, var in self.effort_vars.items()}
+        except (tk.TclError, ValueError):
+            raise ValueError("压缩力度必须是整数")
+        options["codecs"] = make_codecs(names, efforts)
+        options["png_lossless"] = self.png_lossless_var.get()
+
+        mode = self.search_mode_var.get()
+        if mode == self.SEARCH_MODES[0]:
+            return options
+        try:
+            value = float(self.search_value_var.get())
+        except ValueError:
+            raise ValueError(f"请为“{mode}”填写有效的目标值")
+        if value <= 0:
+            raise ValueError(f"请为“{mode}”填写大于0的目标值")
+        if mode == self.SEARCH_MODES[1]:
+            options["target_size"] = int(value * 1024)
+        elif mode == self.SEARCH_MODES[2]:
+            options["min_ssim"] = value
+        else:
+            options["min_psnr"] = value
+        return options
 
     def disable_buttons(self):
         for btn in [self.select_btn, self.clear_btn,
                     self.optimize_btn, self.replace_btn, self.replace_all_btn]:
             btn.config(state=tk.DISABLED)
 
-    def show_batch_progress(self, total_files):
+    def show_batch_progress(self):
         self.batch_progress = tk.Toplevel(self.root)
         self.batch_progress.title("批量处理进度")
         self.batch_progress.geometry("500x250")
@@ -378,13 +1348,13 @@ class ImageOptimizer:
         self.batch_bar = ttk.Progressbar(self.batch_progress,
                                          orient="horizontal", length=450, mode="determinate")
         self.batch_bar.pack(pady=10)
-        self.batch_bar["maximum"] = total_files
+        self.batch_bar["maximum"] = 1
 
         info_frame = ttk.Frame(self.batch_progress)
         info_frame.pack(pady=5)
-        ttk.Label(info_frame, text="总文件数:").pack(side=tk.LEFT)
-        self.total_files_label = ttk.Label(info_frame, text=str(total_files))
-        self.total_files_label.pack(side=tk.LEFT, padx=5)
+        ttk.Label(info_frame, text="已发现:").pack(side=tk.LEFT)
+        self.discovered_label = ttk.Label(info_frame, text="0")
+        self.discovered_label.pack(side=tk.LEFT, padx=5)
         ttk.Label(info_frame, text="已处理:").pack(side=tk.LEFT, padx=10)
         self.processed_label = ttk.Label(info_frame, text="0")
         self.processed_label.pack(side=tk.LEFT)
@@ -414,6 +1384,12 @@ class ImageOptimizer:
             messagebox.showwarning("警告", "请先选择要优化的图片文件！")
             return
 
+        try:
+            self.compress_options = self.get_compress_options()
+        except ValueError as e:
+            messagebox.showwarning("警告", str(e))
+            return
+
         self.processing = True
         self.start_time = time.time()
 
@@ -436,72 +1412,110 @@ class ImageOptimizer:
 
         self.file_counter = ttk.Label(self.progress, text="正在处理第 0 / 0 个文件")
         self.file_counter.pack(pady=5)
+        self.progress.protocol("WM_DELETE_WINDOW", self.cancel_optimization)
 
         self.disable_buttons()
         self.root.after(100, self.process_images)
 
     def process_images(self):
-        total_files = len(self.selected_files)
-        processed_count = 0
-        saved_gb = 0.0
-        output_dirs = set()
+        """在后台线程中运行批处理接口，结果由 poll_results 轮询回填"""
+        self.total_files = len(self.selected_files)
+        self.processed_count = 0
+        self.saved_gb = 0.0
+        self.output_dirs = set()
+        self.index_hits = 0
+        self.index_misses = 0
+        self.codec_stats = {}
+
+        self.result_queue = queue.Queue()
+        Thread(target=self.run_batch,
+               args=(list(self.selected_files), "cfok", self.quality_var.get(),
+                     self.workers_var.get(), self.hash_check_var.get()),
+               daemon=True).start()
+        self.root.after(50, self.poll_results)
+
+    def run_batch(self, files, output_mode, quality, workers, use_hash):
+        """后台线程：把 optimize_files 的结果转发到结果队列，结束时放入 None"""
+        try:
+            for result in optimize_files(files, quality, output_mode, workers,
+                                         index=self.index, use_hash=use_hash,
+                                         output_folder=self.output_folder,
+                                         should_stop=lambda: not self.processing,
+                                         **self.compress_options):
+                self.result_queue.put(result)
+        except Exception as e:
+            logging.error(f"批处理中断：{str(e)}")
+        finally:
+            self.result_queue.put(None)
 
-        while processed_count < total_files and self.processing:
-            index = processed_count
-            file_path = self.selected_files[index]
+    def poll_results(self):
+        """轮询结果队列并更新界面"""
+        if not self.processing:
+            return
+
+        finished = False
+        while True:
             try:
-                # 准备输出路径
-                file_dir = os.path.dirname(file_path)
-                output_dir = os.path.join(file_dir, self.output_folder)
-                os.makedirs(output_dir, exist_ok=True)
-                output_dirs.add(output_dir)
-
-                file_name = os.path.basename(file_path)
-                name, ext = os.path.splitext(file_name)
-                output_path = os.path.join(output_dir, f"{name}.jpg")
-
-                # 转换并优化图片
-                with Image.open(file_path) as img:
-                    original_size = os.path.getsize(file_path)
-                    img.convert("RGB").save(
-                        output_path,
-                        "JPEG",
-                        quality=self.quality_var.get(),
-                        optimize=True,
-                        progressive=True
-                    )
-                    optimized_size = os.path.getsize(output_path)
-                    saved_gb += (original_size - optimized_size) / (1024 ** 3)
-
-                    # 更新列表
-                    item_id = self.file_list.get_children()[index]
-                    self.file_list.set(item_id, "优化后大小", f"{optimized_size / 1024:.2f} KB")
-                    self.file_list.set(item_id, "压缩率",
-                                       f"{(original_size - optimized_size) / original_size * 100:.1f}%")
-
-                # 更新进度
-                processed_count += 1
-                progress = (processed_count / total_files) * 100
-                self.progress_bar["value"] = progress
-                self.file_counter.config(text=f"正在处理第 {processed_count} / {total_files} 个文件")
-                self.root.update()  # 强制更新GUI
-
-                # 计算时间
-                elapsed = time.time() - self.start_time
-                avg_time = elapsed / processed_count
-                remaining = avg_time * (total_files - processed_count)
-                self.update_time_display(elapsed, remaining)
+                result = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                finished = True
+                break
 
-            except Exception as e:
-                logging.error(f"处理文件 {file_name} 时出错：{str(e)}")
+            self.processed_count += 1
+            item_id = self.file_list.get_children()[result["key"]]
+            if result["status"] == "skipped":
+                # 已由本工具优化过的文件直接跳过
+                self.index_hits += 1
+                self.file_list.set(item_id, "优化后大小", "已优化，跳过")
+                continue
+            self.index_misses += 1
+            if result["status"] == "error":
+                logging.error(f"处理文件 {os.path.basename(result['src'])} 时出错：{result['error']}")
                 continue
 
-        if self.processing:
-            self.finish_optimization(saved_gb, output_dirs)
+            original_size = result["original_size"]
+            optimized_size = result["optimized_size"]
+            self.saved_gb += (original_size - optimized_size) / (1024 ** 3)
+            self.output_dirs.add(os.path.dirname(result["dst"]))
+            self.record_codec_stats(result)
+
+            # 更新列表
+            self.file_list.set(item_id, "优化后大小", f"{optimized_size / 1024:.2f} KB")
+            self.file_list.set(item_id, "压缩率",
+                               f"{(original_size - optimized_size) / original_size * 100:.1f}%")
+
+        # 更新进度
+        total_files = self.total_files
+        processed_count = self.processed_count
+        self.progress_bar["value"] = (processed_count / total_files) * 100
+        self.file_counter.config(text=f"正在处理第 {processed_count} / {total_files} 个文件")
+
+        # 计算时间
+        elapsed = time.time() - self.start_time
+        if processed_count:
+            remaining = elapsed / processed_count * (total_files - processed_count)
+        else:
+            remaining = -1
+        self.update_time_display(elapsed, remaining)
+
+        if finished:
+            self.finish_optimization(self.saved_gb, self.output_dirs)
+        else:
+            self.root.after(50, self.poll_results)
+
+    def cancel_optimization(self):
+        """取消优化"""
+        self.processing = False
+        self.index.flush()
+        self.progress.destroy()
+        self.enable_buttons()
 
     # ===================== 共用方法 =====================
     def finish_optimization(self, saved_gb, output_dirs):
         self.processing = False
+        self.index.flush()
         self.progress.destroy()
 
         # 更新累计数据
@@ -519,6 +1533,13 @@ class ImageOptimizer:
             self.open_file(directory)
         self.enable_buttons()
 
+    def record_codec_stats(self, result):
+        """按编码器累计文件数和体积，用于报告"""
+        stats = self.codec_stats.setdefault(result["codec"], [0, 0, 0])
+        stats[0] += 1
+        stats[1] += result["original_size"]
+        stats[2] += result["optimized_size"]
+
     def generate_summary_report(self, saved_gb):
         """生成统计报告"""
         root_dir = self.get_root_dir()
@@ -531,10 +1552,17 @@ class ImageOptimizer:
             f"生成时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
             "-" * 40,
             f"本次节省空间：{saved_mb:.2f} MB",
+            f"本次压缩文件：{self.index_misses} 个",
+            f"跳过已优化文件：{self.index_hits} 个（索引命中）",
             f"累计节省空间：{self.total_saved_gb:.4f} GB",
             f"总使用次数：{self.usage_count} 次",
-            "=" * 40
         ]
+        if self.codec_stats:
+            content.append("-" * 40)
+            content.append("按输出格式统计：")
+            for name, (count, original, optimized) in sorted(self.codec_stats.items()):
+                content.append(f"  {CODECS[name].label}：{count} 个，节省 {(original - optimized) / 1024 ** 2:.2f} MB")
+        content.append("=" * 40)
 
         with open(report_path, "w", encoding="utf-8") as f:
             f.write("\n".join(content))
@@ -583,6 +1611,8 @@ class ImageOptimizer:
                 if os.path.exists(cfok_dir):
                     # 移动并替换文件
                     for opt_file in os.listdir(cfok_dir):
+                        if opt_file.endswith(TEMP_SUFFIX):
+                            continue
                         src_path = os.path.join(cfok_dir, opt_file)
                         base_name = os.path.splitext(opt_file)[0]
 
@@ -599,12 +1629,14 @@ class ImageOptimizer:
                         if os.path.exists(dest_path):
                             os.remove(dest_path)
                         shutil.move(src_path, dest_path)
+                        self.index.move(src_path, dest_path)
 
                     # 删除CFOK目录
                     shutil.rmtree(cfok_dir)
                     processed_dirs.add(file_dir)
 
             # 完成操作
+            self.index.flush()
             self.clear_files()
             messagebox.showinfo("完成", "文件替换完成，CFOK目录已删除")
             for directory in processed_dirs:
@@ -614,58 +1646,57 @@ class ImageOptimizer:
             messagebox.showerror("错误", f"替换失败：{str(e)}")
 
     def process_batch_files(self, file_list, directory):
-        """批量处理线程方法"""
-        total = len(file_list)
+        """批量处理线程方法，file_list 可以是边扫描边产出的迭代器"""
         processed = 0
         saved_gb = 0.0
         output_dirs = set()
 
-        for i, file_path in enumerate(file_list):
-            if not self.processing:
-                break
-            try:
+        results = optimize_files(file_list, self.quality_var.get(), "replace", self.workers_var.get(),
+                                 index=self.index, use_hash=self.hash_check_var.get(),
+                                 output_folder=self.output_folder,
+                                 should_stop=lambda: not self.processing,
+                                 **self.compress_options)
+        try:
+            for result in results:
                 # 更新当前文件显示
-                self.current_file.config(text=f"正在处理：{os.path.basename(file_path)}")
-
-                # 处理逻辑（与单文件处理相同）
-                file_dir = os.path.dirname(file_path)
-                output_dir = os.path.join(file_dir, self.output_folder)
-                os.makedirs(output_dir, exist_ok=True)
-                output_dirs.add(output_dir)
-
-                name, ext = os.path.splitext(os.path.basename(file_path))
-                output_path = os.path.join(output_dir, f"{name}.jpg")
-
-                with Image.open(file_path) as img:
-                    original_size = os.path.getsize(file_path)
-                    img.convert("RGB").save(
-                        output_path,
-                        "JPEG",
-                        quality=self.quality_var.get(),
-                        optimize=True
-                    )
-                    optimized_size = os.path.getsize(output_path)
-                    saved_gb += (original_size - optimized_size) / (1024 ** 3)
-
-                # 删除原始文件
-                os.remove(file_path)
-                # 移动优化文件
-                shutil.move(output_path, file_path)
-
-                # 更新进度
+                self.current_file.config(text=f"已处理：{os.path.basename(result['src'])}")
+
+                if result["status"] == "skipped":
+                    # 已由本工具优化过，跳过重复编码
+                    self.index_hits += 1
+                else:
+                    self.index_misses += 1
+                    if result["status"] == "error":
+                        logging.error(f"批量处理失败：{result['src']} - {result['error']}")
+                    else:
+                        saved_gb += (result["original_size"] - result["optimized_size"]) / (1024 ** 3)
+                        output_dirs.add(os.path.dirname(result["dst"]))
+                        self.record_codec_stats(result)
+
+                # 更新进度（已发现 vs 已处理）
                 processed += 1
-                self.batch_bar.step(1)
+                discovered = max(self.discovered_count, processed)
+                self.batch_bar["maximum"] = discovered
+                self.batch_bar["value"] = processed
+                self.discovered_label.config(text=str(discovered) if self.scan_done else f"{discovered}+")
                 self.processed_label.config(text=str(processed))
 
-                # 计算时间
+                # 计算时间（扫描未结束时总数未知，不估算剩余时间）
                 elapsed = time.time() - self.start_time
-                avg_time = elapsed / processed if processed > 0 else 0
-                remaining = avg_time * (total - processed)
+                if self.scan_done:
+                    remaining = elapsed / processed * (discovered - processed)
+                else:
+                    remaining = -1
                 self.update_batch_time(elapsed, remaining)
+        except Exception as e:
+            logging.error(f"批量处理中断：{str(e)}")
 
-            except Exception as e:
-                logging.error(f"批量处理失败：{str(e)}")
-                continue
+        if self.processing and self.discovered_count == 0:
+            self.processing = False
+            self.batch_progress.destroy()
+            messagebox.showinfo("提示", "所选目录中没有找到图片文件")
+            self.enable_buttons()
+            return
 
         # 完成处理
         self.finish_batch_processing(saved_gb, output_dirs, directory)
@@ -673,7 +1704,10 @@ class ImageOptimizer:
     def update_batch_time(self, elapsed, remaining):
         """更新批量处理时间显示"""
         self.batch_elapsed.config(text=time.strftime("%H:%M:%S", time.gmtime(elapsed)))
-        self.batch_remaining.config(text=time.strftime("%H:%M:%S", time.gmtime(remaining)))
+        if remaining >= 0:
+            self.batch_remaining.config(text=time.strftime("%H:%M:%S", time.gmtime(remaining)))
+        else:
+            self.batch_remaining.config(text="--:--:--")
 
     def cancel_batch_processing(self):
         """取消批量处理"""
@@ -685,6 +1719,7 @@ class ImageOptimizer:
     def finish_batch_processing(self, saved_gb, output_dirs, directory):
         """完成批量处理"""
         self.processing = False
+        self.index.flush()
         self.batch_progress.destroy()
 
         # 更新累计数据
@@ -697,15 +1732,7 @@ class ImageOptimizer:
         report_path = self.generate_summary_report(saved_gb)
         self.show_report_window(report_path)
 
-        # 删除所有子目录下的CFOK目录
-        for root, dirs, _ in os.walk(directory):
-            for dir_name in dirs:
-                if dir_name == self.output_folder:
-                    cfok_dir = os.path.join(root, dir_name)
-                    if os.path.exists(cfok_dir):
-                        shutil.rmtree(cfok_dir)
-
-        messagebox.showinfo("完成", "批量处理已完成，所有子目录下的CFOK目录已删除！")
+        messagebox.showinfo("完成", "批量处理已完成，原文件已被原子替换！")
         self.enable_buttons()
 
     def enable_buttons(self):
@@ -754,6 +1781,8 @@ class ImageOptimizer:
   .显示已选择的文件及其原始大小、优化后大小和压缩率。
 .优化选项：
   .压缩质量：设置压缩质量（1-100），默认为60。
+  .最大边长：大于0时把图片长边缩小到该像素数以内（JPEG按1/2、1/4、1/8直接降采样解码，速度更快），0表示不缩放。
+  .自适应质量：选择“目标大小(KB)”“最低SSIM”或“最低PSNR(dB)”并填写目标值，程序会为每张图片自动搜索合适的压缩质量。
 .操作按钮：
   .开始优化：开始优化已选择的图片文件。
   .替换原文件：将优化后的文件替换原文件，并删除CFOK目录。
@@ -777,12 +1806,16 @@ class ImageOptimizer:
   .会弹出警告对话框，确认操作后开始批量处理。
   .批量处理过程中会显示进度条和时间估计。
   .处理完成后，会生成统计报告。
+6.命令行模式：
+  .带参数运行即进入无界面模式，例如：XZ.py 目录或文件 -q 60 -m replace -j 8 --dry-run。
+  .进度以 JSON Lines 格式逐行输出到标准输出，便于脚本调用和定时任务。
 
 五、注意事项
 1.数据备份：
   .在执行替换原文件或批量处理操作前，请务必对重要数据进行备份，以防误操作导致数据丢失。
 2.文件格式转换：
-  .非JPG格式的图片文件（如PNG、BMP）在优化过程中会被转换为JPG格式。
+  .图片在优化过程中会被转换为所选输出格式（默认JPG），格式改变时扩展名随之改变。
+  .勾选“PNG无损优化”时，带透明通道或不超过256色的PNG只做无损优化（调色板化、压缩参数搜索、去除元数据），格式和画质不变；其他PNG在无损与有损结果中取体积最小者。
 3.文件删除：
   .替换原文件和批量处理操作会永久删除原始图片文件，请谨慎操作。
 4.网络连接：
@@ -809,6 +1842,9 @@ class ImageOptimizer:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        sys.exit(cli_main())
     root = tk.Tk()
     app = ImageOptimizer(root)
     root.mainloop()
@@ -0,0 +1,416 @@
+"""尘飞图片工具性能基准测试
+
+生成可复现的合成图片语料（多种尺寸/格式的照片、多张照片的扫描拼版），测量三条处理流水线：
+  xz      XZ.py 压缩引擎（逐张 compress_image 测延迟，optimize_files 多进程测吞吐）
+  split   AI分割 ImageProcessor.process_image
+  rotate  批量旋转 ImageProcessorPro.process_all
+
+每条流水线在独立子进程中运行，峰值内存互不干扰。结果写入 JSON，可用 --baseline 与其他提交的结果对比：
+  python benchmark.py -o bench_new.json --baseline bench_old.json
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 流水线 -> (模块名, 脚本文件)；XZ 必须以真实模块名导入，多进程子进程才能找到 compress_image
+SCRIPTS = {
+    "xz": ("XZ", "XZ.py"),
+    "split": ("bench_split", "ChenFei AI分割照片专业版V1.0.py"),
+    "rotate": ("bench_rotate", "尘飞照片批量旋转处理V4.1.py"),
+}
+DEFAULT_SIZES = ((640, 480), (1920, 1080), (4000, 3000))
+SHEET_SIZE = (1654, 2339)  # A4 @ 200dpi
+# 对比基线时关注的指标及方向（1 越大越好，-1 越小越好）
+COMPARE_METRICS = {"images_per_sec": 1, "mb_per_sec": 1, "p50_ms": -1, "p95_ms": -1,
+                   "page_peak_mb_p50": -1, "page_peak_mb_max": -1}
+
+
+def load_script(name):
+    """按文件路径导入脚本（脚本名含中文和空格，无法直接 import）"""
+    module_name, file_name = SCRIPTS[name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# ==================== 合成语料 ====================
+def synthetic_photo(rng, width, height):
+    """平滑渐变叠加色块和噪声，压缩特性接近真实照片"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    fx, fy = rng.uniform(0.5, 3.0, 2)
+    base = np.stack([
+        127 + 100 * np.sin(x / width * np.pi * fx + phase) * np.cos(y / height * np.pi * fy)
+        for phase in rng.uniform(0, np.pi, 3)
+    ], axis=-1)
+    for _ in range(6):
+        x0, y0 = rng.integers(0, width), rng.integers(0, height)
+        w, h = rng.integers(width // 10, width // 3), rng.integers(height // 10, height // 3)
+        base[y0:y0 + h, x0:x0 + w] = base[y0:y0 + h, x0:x0 + w] * 0.5 + rng.uniform(0, 255, 3) * 0.5
+    base += rng.normal(0, 6, base.shape)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+
+
+def synthetic_graphic(rng, width, height):
+    """少量平面色块的 RGBA 图（截图、图标类），走 PNG 无损路径"""
+    colors = rng.integers(0, 256, (8, 4)).astype(np.uint8)
+    colors[:, 3] = 255
+    colors[0, 3] = 0
+    blocks = rng.integers(0, len(colors), (height // 32 + 1, width // 32 + 1))
+    indices = np.kron(blocks, np.ones((32, 32), dtype=blocks.dtype))[:height, :width]
+    return Image.fromarray(colors[indices], "RGBA")
+
+
+def synthetic_sheet(rng, photos):
+    """白底扫描拼版：若干张带轻微倾斜的照片，照片之间留白"""
+    sheet = Image.new("RGB", SHEET_SIZE, (250, 250, 250))
+    cell_w, cell_h = SHEET_SIZE[0] // 2, SHEET_SIZE[1] // 2
+    for idx in range(photos):
+        photo = synthetic_photo(rng, int(cell_w * 0.7), int(cell_h * 0.6))
+        angle = rng.uniform(-8, 8)
+        mask = Image.new("L", photo.size, 255).rotate(angle, expand=True)
+        photo = photo.rotate(angle, expand=True)
+        left = (idx % 2) * cell_w + (cell_w - photo.width) // 2
+        top = (idx // 2) * cell_h + (cell_h - photo.height) // 2
+        sheet.paste(photo, (left, top), mask)
+    noise = rng.normal(0, 2, (SHEET_SIZE[1], SHEET_SIZE[0], 1))
+    return Image.fromarray(np.clip(np.asarray(sheet) + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def build_corpus(directory, count, sizes, seed):
+    """生成各流水线的语料，返回 {流水线: [文件路径]}
+
+    同一目录内的文件名主干互不相同，否则压缩到 CFOK 时输出会撞名。
+    """
+    rng = np.random.default_rng(seed)
+    corpus = {"xz": [], "split": [], "rotate": []}
+    for name in corpus:
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    for idx in range(count):
+        width, height = sizes[idx % len(sizes)]
+        photo = synthetic_photo(rng, width, height)
+        path = os.path.join(directory, "xz", f"photo_{idx:04d}_{width}x{height}.jpg")
+        photo.save(path, quality=95)
+        corpus["xz"].append(path)
+        if idx % 3 == 1:
+            path = os.path.join(directory, "xz", f"photo_{idx:04d}_{width}x{height}_png.png")
+            photo.save(path, compress_level=1)
+            corpus["xz"].append(path)
+        if idx % 3 == 2:
+            path = os.path.join(directory, "xz", f"graphic_{idx:04d}_{width}x{height}.png")
+            synthetic_graphic(rng, width, height).save(path, compress_level=1)
+            corpus["xz"].append(path)
+
+        ext = (".jpg", ".png")[idx % 2]
+        path = os.path.join(directory, "rotate", f"photo_{idx:04d}_{width}x{height}{ext}")
+        photo.save(path, **({"quality": 95} if ext == ".jpg" else {}))
+        corpus["rotate"].append(path)
+
+        path = os.path.join(directory, "split", f"sheet_{idx:04d}.jpg")
+        synthetic_sheet(rng, 2 + idx % 3).save(path, quality=95)
+        corpus["split"].append(path)
+    return corpus
+
+
+# ==================== 测量 ====================
+def peak_rss_mb():
+    """当前进程（及已回收子进程）的峰值常驻内存，单位 MB"""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (field, ctypes.c_size_t) for field in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                    "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return {"self": round(counters.PeakWorkingSetSize / 2 ** 20, 1), "children": None}
+
+    import resource
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if os.path.exists("/proc/self/status"):
+        # Linux 的 ru_maxrss 跨 exec 继承父进程的峰值，VmHWM 只统计本进程
+        with open("/proc/self/status") as f:
+            peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        return {"self": round(peak / 1024, 1), "children": round(children / 1024, 1)}
+    unit = 1 if sys.platform == "darwin" else 1024  # macOS 以字节计，Linux 以 KB 计
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20, 1),
+        "children": round(children * unit / 2 ** 20, 1),
+    }
+
+
+def _proc_status_mb(field):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ":")) / 1024
+
+
+def page_peak_tracker():
+    """逐页测量峰值内存增量（MB）的包装器；仅 Linux 可重置峰值（/proc/self/clear_refs），其他平台返回 None
+
+    子进程以固定的 MALLOC_MMAP_THRESHOLD_ 启动，大块内存释放后立即归还系统，逐页数值才可比。
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return None
+    peaks = []
+
+    def track(func):
+        def wrapper(*args, **kwargs):
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            before = _proc_status_mb("VmRSS")
+            try:
+                return func(*args, **kwargs)
+            finally:
+                peaks.append(_proc_status_mb("VmHWM") - before)
+        return wrapper
+
+    track.peaks = peaks
+    return track
+
+
+def summarize(paths, latencies, elapsed, **extra):
+    """由逐张延迟和总耗时计算吞吐与分位数"""
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    result = {
+        "images": len(paths),
+        "input_mb": round(total_bytes / 2 ** 20, 2),
+        "elapsed_sec": round(elapsed, 3),
+        "images_per_sec": round(len(paths) / elapsed, 2) if elapsed else None,
+        "mb_per_sec": round(total_bytes / 2 ** 20 / elapsed, 2) if elapsed else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1) if len(latencies_ms) else None,
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1) if len(latencies_ms) else None,
+    }
+    result.update(extra)
+    return result
+
+
+def timed_calls(func, items):
+    """逐项调用 func，返回 (结果列表, 延迟列表, 总耗时)"""
+    results, latencies = [], []
+    started = time.perf_counter()
+    for item in items:
+        begin = time.perf_counter()
+        results.append(func(item))
+        latencies.append(time.perf_counter() - begin)
+    return results, latencies, time.perf_counter() - started
+
+
+# ==================== 各流水线 ====================
+def bench_xz(paths, output_dir, workers):
+    """压缩引擎：串行 compress_image 测延迟，optimize_files 多进程测吞吐"""
+    xz = load_script("xz")
+
+    def compress(path):
+        dst = os.path.join(output_dir, "serial_" + os.path.basename(path))
+        return xz.compress_image(path, dst, 60)
+
+    results, latencies, elapsed = timed_calls(compress, paths)
+    serial = summarize(paths, latencies, elapsed,
+                       output_mb=round(sum(r[1] for r in results) / 2 ** 20, 2),
+                       by_codec={name: sum(1 for r in results if r[3] == name) for name in {r[3] for r in results}})
+
+    batch_dir = os.path.join(output_dir, "batch")
+    shutil.copytree(os.path.dirname(paths[0]), batch_dir)
+    started = time.perf_counter()
+    events = list(xz.optimize_files([batch_dir], quality=60, workers=workers))
+    elapsed = time.perf_counter() - started
+    # 吞吐只计成功的文件
+    done = [event["src"] for event in events if event["status"] != "error"]
+    parallel = summarize(done, [], elapsed, workers=workers or os.cpu_count(),
+                         errors=len(events) - len(done))
+    parallel.pop("p50_ms")
+    parallel.pop("p95_ms")
+    return {"serial": serial, "parallel": parallel}
+
+
+def bench_split(paths, output_dir, workers):
+    """AI分割：逐张 ImageProcessor.process_image"""
+    splitter = load_script("split")
+    process_image = splitter.ImageProcessor.process_image
+    tracker = page_peak_tracker()
+    if tracker:
+        process_image = tracker(process_image)
+    results, latencies, elapsed = timed_calls(lambda path: process_image(path, output_dir), paths)
+    serial = summarize(paths, latencies, elapsed, crops=sum(len(r) for r in results))
+    if tracker:
+        serial["page_peak_mb_p50"] = round(float(np.percentile(tracker.peaks, 50)), 1)
+        serial["page_peak_mb_max"] = round(max(tracker.peaks), 1)
+    return {"serial": serial}
+
+
+def bench_rotate(paths, output_dir, workers):
+    """批量旋转：串行 rotate_file 测延迟，RotationRunner 进程池测吞吐（与 process_all 提交的任务相同）"""
+    rotator = load_script("rotate")
+    items = [{'path': path, 'angle': -90, 'exif_only': False, 'lossless': True, 'trim': False}
+             for path in paths]
+
+    serial_dir = os.path.join(output_dir, "serial")
+    os.makedirs(serial_dir)
+    results, latencies, elapsed = timed_calls(lambda item: rotator.rotate_task(item, serial_dir), items)
+    serial = summarize(paths, latencies, elapsed, errors=sum(1 for result in results if result.error))
+
+    batch_dir = os.path.join(output_dir, "batch")
+    os.makedirs(batch_dir)
+    runner = rotator.RotationRunner(workers or rotator.WORKER_COUNT)
+    try:
+        started = time.perf_counter()
+        results = list(runner.run(items, batch_dir))
+        elapsed = time.perf_counter() - started
+    finally:
+        runner.shutdown()
+    parallel = summarize(paths, [], elapsed, workers=runner.workers,
+                         errors=sum(1 for result in results if result.error))
+    parallel.pop("p50_ms")
+    parallel.pop("p95_ms")
+    return {"serial": serial, "parallel": parallel}
+
+
+PIPELINES = {"xz": bench_xz, "split": bench_split, "rotate": bench_rotate}
+
+
+def run_pipeline(name, corpus_file, workers):
+    """子进程入口：运行单条流水线并把结果以 JSON 打印到标准输出"""
+    with open(corpus_file, encoding="utf-8") as f:
+        paths = json.load(f)[name]
+    output_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        result = PIPELINES[name](paths, output_dir, workers)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result, ensure_ascii=False))
+
+
+# ==================== 结果与对比 ====================
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import cv2
+    import PIL
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def compare(results, baseline):
+    """打印与基线结果的相对变化，正数表示变好"""
+    for name, stages in results["pipelines"].items():
+        for stage, metrics in stages.items():
+            if not isinstance(metrics, dict):
+                continue
+            old = baseline.get("pipelines", {}).get(name, {}).get(stage)
+            if not isinstance(old, dict):
+                continue
+            for metric, direction in COMPARE_METRICS.items():
+                if metrics.get(metric) and old.get(metric):
+                    change = (metrics[metric] / old[metric] - 1) * 100 * direction
+                    print(f"{name}.{stage}.{metric}: {old[metric]} -> {metrics[metric]} ({change:+.1f}%)")
+        new_rss, old_rss = stages.get("peak_rss_mb", {}), baseline.get("pipelines", {}).get(name, {}).get("peak_rss_mb", {})
+        if new_rss.get("self") and old_rss.get("self"):
+            change = (1 - new_rss["self"] / old_rss["self"]) * 100
+            print(f"{name}.peak_rss_mb: {old_rss['self']} -> {new_rss['self']} ({change:+.1f}%)")
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="尘飞图片工具性能基准测试")
+    parser.add_argument("-p", "--pipeline", action="append", choices=list(PIPELINES),
+                        help="要测量的流水线，可重复指定（默认全部）")
+    parser.add_argument("-n", "--count", type=int, default=12, help="每条流水线的基础图片数")
+    parser.add_argument("--sizes", nargs="+", type=parse_size,
+                        default=list(DEFAULT_SIZES), help="照片尺寸，如 640x480 1920x1080")
+    parser.add_argument("--seed", type=int, default=2025, help="语料随机种子，相同种子生成相同语料")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="xz 多进程吞吐测试的进程数")
+    parser.add_argument("--corpus", help="语料目录（默认临时目录，测完删除）")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON")
+    parser.add_argument("--run", choices=list(PIPELINES), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        run_pipeline(args.run, args.corpus, args.workers)
+        return 0
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="bench_corpus_")
+    try:
+        corpus = build_corpus(corpus_dir, args.count, args.sizes, args.seed)
+        corpus_file = os.path.join(corpus_dir, "corpus.json")
+        with open(corpus_file, "w", encoding="utf-8") as f:
+            json.dump(corpus, f, ensure_ascii=False)
+
+        results = {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "environment": environment(),
+            "corpus": {"count": args.count, "seed": args.seed, "sizes": [f"{w}x{h}" for w, h in args.sizes],
+                       "sheet_size": "%dx%d" % SHEET_SIZE},
+            "pipelines": {},
+        }
+        for name in args.pipeline or list(PIPELINES):
+            command = [sys.executable, os.path.abspath(__file__), "--run", name, "--corpus", corpus_file]
+            if args.workers:
+                command += ["--workers", str(args.workers)]
+            env = dict(os.environ, MALLOC_MMAP_THRESHOLD_="131072")
+            completed = subprocess.run(command, capture_output=True, text=True, encoding="utf-8", env=env)
+            if completed.returncode != 0:
+                results["pipelines"][name] = {"error": completed.stderr.strip().splitlines()[-1:]}
+                print(f"{name}: 失败\n{completed.stderr}", file=sys.stderr)
+                continue
+            results["pipelines"][name] = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{name}: {json.dumps(results['pipelines'][name], ensure_ascii=False)}")
+    finally:
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入：{args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import XZ
+
+
+def make_photos(directory, names):
+    rng = np.random.default_rng(0)
+    for name in names:
+        pixels = (rng.random((120, 160, 3)) * 255).astype(np.uint8)
+        Image.fromarray(pixels).save(os.path.join(directory, name), quality=95)
+
+
+def run(directory, index, output_mode="cfok", **options):
+    results = list(XZ.optimize_files([str(directory)], 60, output_mode, workers=1, index=index, **options))
+    index.flush()
+    return sorted(result["status"] for result in results)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = XZ.OptimizedIndex(str(tmp_path / "index.db"))
+    yield index
+    index._conn.close()
+
+
+def test_cfok_rerun_skips_sources(tmp_path, index):
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    make_photos(photos, ["a.jpg", "b.jpg"])
+    assert run(photos, index) == ["optimized", "optimized"]
+    assert run(photos, index) == ["skipped", "skipped"]
+
+
+def test_replace_after_cfok_compresses_originals(tmp_path, index):
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    make_photos(photos, ["a.jpg", "b.jpg"])
+    originals = {name: (photos / name).read_bytes() for name in ("a.jpg", "b.jpg")}
+    assert run(photos, index) == ["optimized", "optimized"]
+
+    assert run(photos, index, "replace") == ["optimized", "optimized"]
+    for name, data in originals.items():
+        assert (photos / name).read_bytes() != data
+    assert run(photos, index, "replace") == ["skipped", "skipped"]
+
+
+def test_cli_without_stdout_writes_output_file(tmp_path, monkeypatch):
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    make_photos(photos, ["a.jpg"])
+    monkeypatch.setattr(XZ, "get_root_dir", lambda: str(tmp_path))
+    monkeypatch.setattr("sys.stdout", None)
+    assert XZ.cli_main([str(photos), "--no-index", "-j", "1"]) == 0
+
+    lines = (tmp_path / XZ.CLI_OUTPUT_FILE).read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["event"] for line in lines] == ["start", "file", "summary"]
+
+
+def test_changed_search_target_reprocesses(tmp_path, index):
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    make_photos(photos, ["a.jpg"])
+    assert run(photos, index, target_size=400 * 1024) == ["optimized"]
+    assert run(photos, index, target_size=400 * 1024) == ["skipped"]
+    assert run(photos, index, target_size=10 * 1024) == ["optimized"]
+    assert run(photos, index, min_ssim=0.9) == ["optimized"]
+    assert run(photos, index) == ["optimized"]
+
+
+def test_png_colour_key_transparency_survives(tmp_path):
+    pixels = np.zeros((40, 60, 3), dtype=np.uint8)
+    pixels[:, :30] = (255, 0, 0)
+    pixels[10:20, 40:50] = (0, 0, 255)
+    src = tmp_path / "key.png"
+    Image.fromarray(pixels).save(src, transparency=(0, 0, 0))
+    with Image.open(src) as img:
+        expected = np.asarray(img.convert("RGBA"))
+
+    dst = tmp_path / "out.png"
+    XZ.compress_image(str(src), str(dst), 60)
+    with Image.open(dst) as img:
+        assert np.array_equal(np.asarray(img.convert("RGBA")), expected)
@@ -1,9 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
+import io
 import os
+import queue
+import threading
+import time
+import multiprocessing
+import shutil
 import subprocess
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from typing import NamedTuple, Optional
 import uuid
 import requests
 import webbrowser
@@ -11,6 +22,280 @@ import webbrowser
 # 假设这是当前软件的版本号
 CURRENT_VERSION = "4.1"
 
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+THUMBNAIL_SIZE = 160  # 缩略图模式插槽中的预览尺寸
+THUMBNAIL_CACHE_SIZE = 256  # 内存中至少保留的已解码缩略图数量，预览窗口更大时自动扩容
+PREVIEW_THUMB_SIZE = 120  # 批量模式预览格子中缩略图的尺寸
+PREVIEW_CELL = (140, 160)  # 预览格子的宽、高（含文件名）
+PREVIEW_WORKERS = 2  # 后台解码预览的线程数
+PREVIEW_POLL_MS = 50  # 界面线程收取解码结果的间隔
+WORKER_COUNT = min(os.cpu_count() or 1, 61)  # Windows 的进程池最多 61 个进程
+IN_FLIGHT_PER_WORKER = 2  # 每个工作进程最多排队的任务数，停止后只需等这些任务完成
+PROGRESS_INTERVAL_MS = 200  # 批处理时刷新进度条和状态栏的间隔
+MAX_ERROR_DETAILS = 20  # 完成提示中最多列出的失败文件数，完整列表写入报告文件
+FAILURE_REPORT_NAME = "rotate_failures.txt"
+# 顺时针旋转角度 -> EXIF 方向标记值（看图软件按该值旋转显示）
+EXIF_ORIENTATIONS = {0: 1, 90: 6, 180: 3, 270: 8}
+# 可选的 libjpeg-turbo jpegtran：在 PATH 中或放在程序目录下时优先用它做无损旋转，速度快得多
+JPEGTRAN = shutil.which("jpegtran") or shutil.which("jpegtran", path=os.path.dirname(os.path.abspath(sys.argv[0])))
+
+
+# ---------------------------------------------------------------------------
+# JPEG 无损旋转：交给 libjpeg-turbo 的 jpegtran 重排 DCT 系数，不解码到像素、不重新量化
+# ---------------------------------------------------------------------------
+
+class LosslessUnavailable(Exception):
+    """无法无损旋转（没有 jpegtran、边缘不足一个 MCU 等），调用方改用像素旋转"""
+
+
+def _frame_header(data):
+    """只读到帧头，返回 (宽, 高, 最大水平采样, 最大垂直采样)"""
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            payload = data[pos + 4:pos + 2 + length]
+            height = int.from_bytes(payload[1:3], "big")
+            width = int.from_bytes(payload[3:5], "big")
+            sampling = [payload[7 + 3 * c] for c in range(payload[5])]
+            if len(sampling) == 1:
+                return width, height, 1, 1
+            return width, height, max(s >> 4 for s in sampling), max(s & 15 for s in sampling)
+        pos += 2 + length
+    raise LosslessUnavailable("缺少帧头")
+
+
+def _check_edges(width, height, hmax, vmax, clockwise, trim):
+    """调用 jpegtran 前检查要翻转的方向上尺寸是否为 MCU 整数倍，不能完美无损又不允许裁边时直接放弃"""
+    axes = {0: (), 90: ((height, vmax),), 180: ((width, hmax), (height, vmax)), 270: ((width, hmax),)}
+    for size, sampling in axes[clockwise]:
+        unit = 8 * sampling
+        if size % unit and (not trim or size < unit):
+            raise LosslessUnavailable("图像边缘不足一个 MCU")
+
+
+def _find_ifd_orientation(f, start, end=None):
+    """在从 start 开始的 TIFF 结构中查找 IFD0 的方向标记（SHORT），返回 (值的文件偏移, 字节序)"""
+    f.seek(start)
+    header = f.read(8)
+    if header[:4] not in (b"II*\x00", b"MM\x00*"):
+        return None
+    order = "little" if header[:2] == b"II" else "big"
+    ifd = start + int.from_bytes(header[4:8], order)
+    f.seek(ifd)
+    count = int.from_bytes(f.read(2), order)
+    entries = f.read(12 * count)
+    for i in range(len(entries) // 12):
+        entry = entries[12 * i:12 * i + 12]
+        if int.from_bytes(entry[:2], order) == 0x0112 and int.from_bytes(entry[2:4], order) == 3:
+            offset = ifd + 2 + 12 * i + 8
+            return (offset, order) if end is None or offset + 2 <= end else None
+    return None
+
+
+def find_exif_orientation(f):
+    """在 JPEG（APP1 EXIF）或 TIFF 文件中查找方向标记，返回 (值的文件偏移, 字节序)，没有时返回 None"""
+    f.seek(0)
+    head = f.read(4)
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return _find_ifd_orientation(f, 0)
+    if head[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while True:
+        f.seek(pos)
+        marker = f.read(10)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xDA, 0xD9):
+            return None
+        length = int.from_bytes(marker[2:4], "big")
+        if marker[1] == 0xE1 and marker[4:10] == b"Exif\x00\x00":
+            found = _find_ifd_orientation(f, pos + 10, pos + 2 + length)
+            if found:
+                return found
+        pos += 2 + length
+
+
+def set_exif_orientation(data, value):
+    """在 JPEG/TIFF 字节中原地改写方向标记，返回是否找到该标记"""
+    found = find_exif_orientation(io.BytesIO(data))
+    if found:
+        offset, order = found
+        data[offset:offset + 2] = value.to_bytes(2, order)
+    return found is not None
+
+
+def rotate_by_exif(path, save_path, clockwise):
+    """只改写方向标记的旋转：复制原文件后原地改写 2 个字节，像素数据一字节不动
+
+    方向按预览所见（不考虑原有方向标记）的像素顺时针旋转 clockwise 度给出。
+    文件没有方向标记时不写输出，返回 False，由调用方改用其他旋转方式。
+    """
+    with open(path, "rb") as f:
+        found = find_exif_orientation(f)
+    if not found:
+        return False
+    offset, order = found
+    shutil.copyfile(path, save_path)
+    with open(save_path, "r+b") as f:
+        f.seek(offset)
+        f.write(EXIF_ORIENTATIONS[clockwise].to_bytes(2, order))
+    return True
+
+
+def _jpegtran(path, clockwise, trim):
+    """调用 libjpeg-turbo 的 jpegtran 做无损变换，返回输出字节
+
+    调用前已用 _check_edges 确认过边缘，-perfect 只在确实不用裁边时使用。
+    """
+    command = [JPEGTRAN, "-copy", "all", "-optimize", "-trim" if trim else "-perfect"]
+    if clockwise:
+        command += ["-rotate", str(clockwise)]
+    result = subprocess.run(command + [path], capture_output=True,
+                            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+    if result.returncode or not result.stdout:
+        raise LosslessUnavailable(result.stderr.decode(errors="replace").strip() or "jpegtran 失败")
+    return result.stdout
+
+
+def rotate_jpeg_lossless(path, clockwise, trim=False):
+    """无损旋转 JPEG 文件，返回新文件的字节；不能无损时抛出 LosslessUnavailable
+
+    像素按预览所见方向（不考虑 EXIF 方向）旋转，所以结果中的 EXIF 方向标记重置为 1。
+    """
+    if not JPEGTRAN:
+        raise LosslessUnavailable("未找到 jpegtran")
+    with open(path, "rb") as f:
+        _check_edges(*_frame_header(f.read()), clockwise, trim)
+    try:
+        data = bytearray(_jpegtran(path, clockwise, trim))
+    except OSError as e:
+        raise LosslessUnavailable(str(e)) from None
+    set_exif_orientation(data, 1)
+    return data
+
+
+class ThumbnailCache:
+    """已缩小解码的预览图缓存，按 (路径, 修改时间, 文件大小, 尺寸) 区分，最近最少使用的先淘汰
+
+    预览的旋转只作用在缓存的小图上；文件被改写后修改时间或大小变化，自然重新解码。
+    """
+
+    def __init__(self, capacity=THUMBNAIL_CACHE_SIZE):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, size, load=True):
+        """返回长边不超过 size 的 PIL 图像，调用方不要原地修改；load 为 False 时未缓存则返回 None"""
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size, size)
+        with self.lock:
+            thumb = self.items.get(key)
+            if thumb is not None:
+                self.items.move_to_end(key)
+                return thumb
+        if not load:
+            return None
+        thumb = self.load(path, size)
+        with self.lock:
+            self.items[key] = thumb
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+        return thumb
+
+    def reserve(self, count):
+        """保证至少能同时保留 count 张，避免大窗口下可见和预取的小图在显示前就被淘汰"""
+        with self.lock:
+            self.capacity = max(self.capacity, count)
+
+    @staticmethod
+    def load(path, size):
+        """JPEG 用 draft 模式在解码时按 1/2~1/8 缩小，再缩到目标尺寸"""
+        with Image.open(path) as img:
+            img.draft('RGB', (size, size))
+            img.thumbnail((size, size))
+            img.load()  # 原图已小于 size 时 thumbnail 不会读取像素，关闭文件前读完
+            return img
+
+
+class RotateResult(NamedTuple):
+    """单个文件的旋转结果；path 为 None 表示批处理本身出错"""
+    path: Optional[str]
+    save_path: Optional[str]
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+def rotate_task(item, output_dir):
+    """工作进程入口：旋转一个文件，异常转为 RotateResult 返回"""
+    started = time.perf_counter()
+    try:
+        save_path = ImageProcessorPro.rotate_file(item, output_dir)
+    except Exception as e:
+        return RotateResult(item['path'], None, str(e) or type(e).__name__, time.perf_counter() - started)
+    return RotateResult(item['path'], save_path, None, time.perf_counter() - started)
+
+
+class RotationRunner:
+    """进程池批量旋转：有界地提交任务，按完成顺序逐个产出 RotateResult"""
+
+    def __init__(self, workers=WORKER_COUNT):
+        self.workers = workers
+        self.pool = None
+
+    def run(self, items, output_dir, should_stop=lambda: False):
+        """should_stop 返回 True 后不再提交新任务，已在途的任务完成后结束
+
+        某个文件让工作进程崩溃时，进程池里在途的任务全部失败：这些文件在重建的进程池中
+        逐个重试一次，只有再次崩溃的文件记为失败，批处理继续。
+        """
+        items = iter(items)
+        pending = {}
+        retry = []
+        while True:
+            while not should_stop():
+                if retry:
+                    if pending:
+                        break
+                    item, retried = retry.pop(0), True
+                elif len(pending) < self.workers * IN_FLIGHT_PER_WORKER:
+                    item, retried = next(items, None), False
+                    if item is None:
+                        break
+                else:
+                    break
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                pending[self.pool.submit(rotate_task, item, output_dir)] = (item, retried)
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, retried = pending.pop(future)
+                try:
+                    yield future.result()
+                except BrokenProcessPool:
+                    if self.pool is not None:
+                        self.pool.shutdown(wait=False)
+                        self.pool = None
+                    if retried:
+                        yield RotateResult(item['path'], None, "处理进程意外退出")
+                    else:
+                        retry.append(item)
+                except Exception as e:
+                    yield RotateResult(item['path'], None, str(e) or type(e).__name__)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
 
 class ImageProcessorPro:
     def __init__(self, root):
@@ -21,10 +306,18 @@ class ImageProcessorPro:
         self.thumbnail_slots = []
         self.batch_files = []
         self.current_rotation = 0
+        self.thumbnail_cache = ThumbnailCache()
+        self.runner = None
+        self.result_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.batch_stats = None
+        self.process_buttons = []
+        self.stop_buttons = []
 
         self.create_widgets()
         self.center_window()
         self.root.bind("<MouseWheel>", self.on_mousewheel)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # 检查更新
         self.check_for_updates()
@@ -124,10 +417,16 @@ class ImageProcessorPro:
         btn_config = {'padding': 6, 'width': 18}
         ttk.Button(btn_frame, text="全部旋转",
                    command=self.rotate_all_thumbnails, **btn_config).grid(row=0, column=0, padx=5)
-        ttk.Button(btn_frame, text="开始处理",
-                   command=self.process_all, **btn_config).grid(row=0, column=1, padx=5)
+        process_btn = ttk.Button(btn_frame, text="开始处理",
+                                 command=self.process_all, **btn_config)
+        process_btn.grid(row=0, column=1, padx=5)
         ttk.Button(btn_frame, text="清空全部",
                    command=self.clear_all_thumbnails, **btn_config).grid(row=0, column=2, padx=5)
+        stop_btn = ttk.Button(btn_frame, text="停止处理", command=self.stop_event.set,
+                              state=tk.DISABLED, **btn_config)
+        stop_btn.grid(row=1, column=1, padx=5, pady=5)
+        self.process_buttons.append(process_btn)
+        self.stop_buttons.append(stop_btn)
 
         self.thumbnail_progress = ttk.Progressbar(right_frame, orient="horizontal", length=400)
         self.thumbnail_progress.pack(pady=15)
@@ -156,31 +455,37 @@ class ImageProcessorPro:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.batch_listbox.pack(fill=tk.BOTH, expand=True)
 
-        # 实时预览区域（显示前20个文件）
-        preview_frame = ttk.LabelFrame(main_frame, text="实时预览（前20个文件）")
-        preview_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        # 实时预览区域：虚拟化网格，只为可见行摆放格子，缩略图在后台按滚动顺序解码
+        self.preview_frame = ttk.LabelFrame(main_frame, text="实时预览")
+        self.preview_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+
+        self.preview_canvas = tk.Canvas(self.preview_frame, height=200, highlightthickness=0,
+                                        yscrollincrement=20)
+        v_scroll = ttk.Scrollbar(self.preview_frame, orient="vertical", command=self.preview_canvas.yview)
 
-        # 双滚动条容器
-        self.preview_canvas = tk.Canvas(preview_frame, height=200, highlightthickness=0)
-        h_scroll = ttk.Scrollbar(preview_frame, orient="horizontal", command=self.preview_canvas.xview)
-        v_scroll = ttk.Scrollbar(preview_frame, orient="vertical", command=self.preview_canvas.yview)
+        # 滚动或改变大小后重新摆放格子
+        def on_scroll(first, last):
+            v_scroll.set(first, last)
+            self.schedule_preview_layout()
 
-        self.preview_container = ttk.Frame(self.preview_canvas)
-        self.preview_canvas.create_window((0, 0), window=self.preview_container, anchor="nw")
+        self.preview_canvas.configure(yscrollcommand=on_scroll)
+        self.preview_canvas.bind("<Configure>", lambda e: self.schedule_preview_layout())
 
-        # 配置滚动区域
-        self.preview_container.bind("<Configure>",
-                                    lambda e: self.preview_canvas.configure(
-                                        scrollregion=self.preview_canvas.bbox("all")
-                                    ))
-        self.preview_canvas.configure(xscrollcommand=h_scroll.set, yscrollcommand=v_scroll.set)
+        self.preview_cells = []  # 回收复用的格子（边框、图片、文字三个画布项）
+        self.preview_photos = {}  # 路径 -> 当前角度的 PhotoImage，只保留可见和预取范围内的
+        self.preview_failed = {}  # 路径 -> 解码失败原因
+        self.preview_wanted = set()  # 可见和预取范围内的路径，后台线程据此跳过已滚走的任务
+        self.preview_pending = set()
+        self.preview_ready = queue.Queue()
+        self.preview_executor = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS)
+        self.preview_layout_scheduled = False
+        self.preview_polling = False
 
         # 布局组件
         self.preview_canvas.grid(row=0, column=0, sticky="nsew")
         v_scroll.grid(row=0, column=1, sticky="ns")
-        h_scroll.grid(row=1, column=0, sticky="ew")
-        preview_frame.grid_rowconfigure(0, weight=1)
-        preview_frame.grid_columnconfigure(0, weight=1)
+        self.preview_frame.grid_rowconfigure(0, weight=1)
+        self.preview_frame.grid_columnconfigure(0, weight=1)
 
         # 操作控制面板
         control_frame = ttk.Frame(main_frame)
@@ -219,6 +524,24 @@ class ImageProcessorPro:
                         value="counter_clockwise",
                         command=self.update_batch_previews).pack(side=tk.LEFT, padx=10)
 
+        # 无损旋转选项
+        self.exif_only_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rotate_frame,
+                        text="仅改EXIF方向（最快）",
+                        variable=self.exif_only_var).pack(side=tk.LEFT, padx=10)
+        # 无损旋转依赖 jpegtran，找不到时两个选项不可用
+        lossless_state = tk.NORMAL if JPEGTRAN else tk.DISABLED
+        self.lossless_var = tk.BooleanVar(value=JPEGTRAN is not None)
+        ttk.Checkbutton(rotate_frame,
+                        text="JPEG无损旋转" if JPEGTRAN else "JPEG无损旋转（未找到jpegtran）",
+                        variable=self.lossless_var,
+                        state=lossless_state).pack(side=tk.LEFT, padx=10)
+        self.trim_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rotate_frame,
+                        text="JPEG无损旋转时裁掉不完整的边缘块",
+                        variable=self.trim_var,
+                        state=lossless_state).pack(side=tk.LEFT, padx=10)
+
         # 应用预览按钮
         ttk.Button(rotate_frame,
                    text="更新预览",
@@ -236,71 +559,157 @@ class ImageProcessorPro:
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(pady=10, fill=tk.X)
 
-        ttk.Button(btn_frame,
-                   text="执行批量处理",
-                   command=self.process_all,
-                   style='Accent.TButton').pack(fill=tk.X, pady=5)
+        stop_btn = ttk.Button(btn_frame,
+                              text="停止",
+                              command=self.stop_event.set,
+                              state=tk.DISABLED)
+        stop_btn.pack(side=tk.RIGHT, padx=(5, 0), pady=5)
+        process_btn = ttk.Button(btn_frame,
+                                 text="执行批量处理",
+                                 command=self.process_all,
+                                 style='Accent.TButton')
+        process_btn.pack(fill=tk.X, pady=5)
+        self.process_buttons.append(process_btn)
+        self.stop_buttons.append(stop_btn)
 
     def on_mousewheel(self, event):
-        """鼠标滚轮控制水平滚动"""
+        """鼠标滚轮滚动预览网格"""
         if event.delta > 0:
-            self.preview_canvas.xview_scroll(-1, "units")
+            self.preview_canvas.yview_scroll(-1, "units")
         else:
-            self.preview_canvas.xview_scroll(1, "units")
+            self.preview_canvas.yview_scroll(1, "units")
 
     def update_batch_previews(self):
-        """更新所有文件的实时预览（仅显示前20个）"""
-        # 清空现有预览
-        for widget in self.preview_container.winfo_children():
-            widget.destroy()
-
+        """文件列表或旋转角度变化后刷新预览网格"""
         # 计算最终旋转角度
         base_angle = self.rotation_var.get()
         direction = -1 if self.direction_var.get() == "clockwise" else 1
         self.current_rotation = base_angle * direction
 
-        # 网格布局参数
-        thumbs_per_row = 5
-        thumb_size = 120
-
-        # 生成缩略图网格（仅显示前20个文件）
-        row_frame = None
-        for idx, path in enumerate(self.batch_files[:20]):
+        # 角度变了，已生成的 PhotoImage 作废；缓存中的小图仍然有效
+        self.preview_photos.clear()
+        self.preview_frame.configure(text=f"实时预览（共 {len(self.batch_files)} 个文件）")
+        self.schedule_preview_layout()
+
+    def schedule_preview_layout(self):
+        """合并同一轮事件中的多次重排请求"""
+        if not self.preview_layout_scheduled:
+            self.preview_layout_scheduled = True
+            self.root.after_idle(self.layout_previews)
+
+    def layout_previews(self):
+        """把回收的格子摆到当前可见的行上，并安排可见行和下一屏的后台解码"""
+        self.preview_layout_scheduled = False
+        canvas = self.preview_canvas
+        cell_w, cell_h = PREVIEW_CELL
+        count = len(self.batch_files)
+        cols = max(1, canvas.winfo_width() // cell_w)
+        screen_rows = max(1, canvas.winfo_height() // cell_h) + 1
+        canvas.configure(scrollregion=(0, 0, cols * cell_w, -(-count // cols) * cell_h))
+
+        first = int(canvas.canvasy(0) // cell_h) * cols
+        visible = range(min(first, count), min(first + screen_rows * cols, count))
+        prefetch = range(visible.stop, min(visible.stop + screen_rows * cols, count))
+
+        while len(self.preview_cells) < screen_rows * cols:
+            self.preview_cells.append({
+                'rect': canvas.create_rectangle(0, 0, 0, 0, outline="#c8c8c8"),
+                'image': canvas.create_image(0, 0, anchor="n"),
+                'text': canvas.create_text(0, 0, anchor="n", width=cell_w - 20,
+                                           font=('Arial', 8), justify=tk.CENTER),
+            })
+
+        self.thumbnail_cache.reserve(THUMBNAIL_CACHE_SIZE + 2 * screen_rows * cols + len(self.thumbnail_slots))
+        self.preview_wanted = {self.batch_files[i] for i in (*visible, *prefetch)}
+        for path in list(self.preview_photos):
+            if path not in self.preview_wanted:
+                del self.preview_photos[path]
+
+        for slot, cell in enumerate(self.preview_cells):
+            index = first + slot
+            if index not in visible:
+                for item in cell.values():
+                    canvas.itemconfigure(item, state="hidden")
+                continue
+            path = self.batch_files[index]
+            row, col = divmod(index, cols)
+            x, y = col * cell_w, row * cell_h
+            photo = self.get_preview_photo(path)
+            if photo is not None:
+                caption = f"旋转角度：{self.current_rotation}°"
+            else:
+                caption = "预览失败" if path in self.preview_failed else "加载中…"
+            canvas.coords(cell['rect'], x + 5, y + 5, x + cell_w - 5, y + cell_h - 5)
+            canvas.coords(cell['image'], x + cell_w // 2, y + 10)
+            canvas.coords(cell['text'], x + cell_w // 2, y + 15 + PREVIEW_THUMB_SIZE)
+            canvas.itemconfigure(cell['image'], image=photo or "", state="normal")
+            canvas.itemconfigure(cell['text'], text=f"{os.path.basename(path)[:15]}\n{caption}", state="normal")
+            canvas.itemconfigure(cell['rect'], state="normal")
+
+        # 先提交可见的，再提交下一屏，线程池按提交顺序解码；预取的只进缓存，以缓存判断是否已解码
+        for index in (*visible, *prefetch):
+            path = self.batch_files[index]
+            if (path in self.preview_photos or path in self.preview_pending
+                    or path in self.preview_failed or self.is_preview_cached(path)):
+                continue
+            self.preview_pending.add(path)
+            self.preview_executor.submit(self.decode_preview, path)
+        if self.preview_pending and not self.preview_polling:
+            self.preview_polling = True
+            self.root.after(PREVIEW_POLL_MS, self.poll_previews)
+
+    def is_preview_cached(self, path):
+        """预览小图是否已在缓存中；文件读不到时交给后台解码记录失败"""
+        try:
+            return self.thumbnail_cache.get(path, PREVIEW_THUMB_SIZE, load=False) is not None
+        except OSError:
+            return False
+
+    def get_preview_photo(self, path):
+        """返回当前角度的预览 PhotoImage；小图已在缓存中时直接旋转生成，否则返回 None 等后台解码"""
+        photo = self.preview_photos.get(path)
+        if photo is None and path not in self.preview_failed:
             try:
-                # 每行创建新容器
-                if idx % thumbs_per_row == 0:
-                    row_frame = ttk.Frame(self.preview_container)
-                    row_frame.pack(fill=tk.X, pady=5)
-
-                # 单个缩略图容器
-                thumb_frame = ttk.Frame(row_frame, relief="groove", borderwidth=1)
-                thumb_frame.pack(side=tk.LEFT, padx=5, pady=5)
-
-                # 加载并旋转图片
-                with Image.open(path) as img:
-                    rotated_img = img.rotate(self.current_rotation, expand=True)
-                    thumbnail = self.create_thumbnail(rotated_img, (thumb_size, thumb_size))
-
-                # 显示缩略图
-                label = ttk.Label(thumb_frame, image=thumbnail)
-                label.image = thumbnail
-                label.pack()
-
-                # 显示文件信息
-                info_text = f"{os.path.basename(path)[:15]}\n旋转角度：{self.current_rotation}°"
-                ttk.Label(thumb_frame,
-                          text=info_text,
-                          wraplength=thumb_size - 20,
-                          font=('Arial', 8),
-                          justify=tk.CENTER).pack()
-
+                thumb = self.thumbnail_cache.get(path, PREVIEW_THUMB_SIZE, load=False)
+            except OSError:
+                thumb = None
+            if thumb is not None:
+                photo = self.create_thumbnail(thumb.rotate(self.current_rotation, expand=True),
+                                              (PREVIEW_THUMB_SIZE, PREVIEW_THUMB_SIZE))
+                self.preview_photos[path] = photo
+        return photo
+
+    def decode_preview(self, path):
+        """后台线程：把缩略图解码进缓存；已滚出可见和预取范围的直接跳过"""
+        error = None
+        if path in self.preview_wanted:
+            try:
+                self.thumbnail_cache.get(path, PREVIEW_THUMB_SIZE)
             except Exception as e:
-                print(f"生成预览失败：{str(e)}")
+                error = str(e)
+        self.preview_ready.put((path, error))
 
-        # 更新界面
-        self.preview_canvas.update_idletasks()
+    def poll_previews(self):
+        """界面线程定时收取后台解码结果，有新结果时重排可见格子"""
+        received = False
+        while True:
+            try:
+                path, error = self.preview_ready.get_nowait()
+            except queue.Empty:
+                break
+            received = True
+            self.preview_pending.discard(path)
+            if error is not None:
+                self.preview_failed[path] = error
+                print(f"生成预览失败：{error}")
+        if received:
+            self.schedule_preview_layout()
+        if self.preview_pending:
+            self.root.after(PREVIEW_POLL_MS, self.poll_previews)
+        else:
+            self.preview_polling = False
 
-    def create_thumbnail(self, img, size=(160, 160)):
+    def create_thumbnail(self, img, size=(THUMBNAIL_SIZE, THUMBNAIL_SIZE)):
         """生成缩略图"""
         img_copy = img.copy()
         img_copy.thumbnail(size)
@@ -309,41 +718,42 @@ class ImageProcessorPro:
     def add_thumbnail(self, idx):
         """添加缩略图"""
         file_path = filedialog.askopenfilename(
-            filetypes=[("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif")]
+            filetypes=[("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif *.tif *.tiff")]
         )
         if not file_path:
             return
 
         try:
-            with Image.open(file_path) as img:
-                slot = self.thumbnail_slots[idx]
-                slot['add_btn'].pack_forget()
-
-                thumbnail = self.create_thumbnail(img)
-                slot['label'] = ttk.Label(slot['frame'], image=thumbnail)
-                slot['label'].image = thumbnail
-                slot['label'].pack()
-
-                btn_frame = ttk.Frame(slot['frame'])
-                btn_frame.pack()
-
-                slot['rotate_btn'] = ttk.Button(
-                    btn_frame, text="↻ 旋转",
-                    command=lambda idx=idx: self.rotate_thumbnail(idx)
-                )
-                slot['rotate_btn'].pack(side=tk.LEFT, padx=2)
-
-                slot['clear_btn'] = ttk.Button(
-                    btn_frame, text="× 清除",
-                    command=lambda idx=idx: self.clear_thumbnail_slot(idx)
-                )
-                slot['clear_btn'].pack(side=tk.LEFT, padx=2)
-
-                slot.update({
-                    'path': file_path,
-                    'image': img.copy(),
-                    'rotation': 0
-                })
+            # 取缓存中缩小解码的图，之后旋转也只处理这张小图
+            img = self.thumbnail_cache.get(file_path, THUMBNAIL_SIZE)
+            slot = self.thumbnail_slots[idx]
+            slot['add_btn'].pack_forget()
+
+            thumbnail = self.create_thumbnail(img)
+            slot['label'] = ttk.Label(slot['frame'], image=thumbnail)
+            slot['label'].image = thumbnail
+            slot['label'].pack()
+
+            btn_frame = ttk.Frame(slot['frame'])
+            btn_frame.pack()
+
+            slot['rotate_btn'] = ttk.Button(
+                btn_frame, text="↻ 旋转",
+                command=lambda idx=idx: self.rotate_thumbnail(idx)
+            )
+            slot['rotate_btn'].pack(side=tk.LEFT, padx=2)
+
+            slot['clear_btn'] = ttk.Button(
+                btn_frame, text="× 清除",
+                command=lambda idx=idx: self.clear_thumbnail_slot(idx)
+            )
+            slot['clear_btn'].pack(side=tk.LEFT, padx=2)
+
+            slot.update({
+                'path': file_path,
+                'image': img,
+                'rotation': 0
+            })
         except Exception as e:
             messagebox.showerror("加载失败", f"无法读取图片：{str(e)}")
 
@@ -387,7 +797,7 @@ class ImageProcessorPro:
     def add_batch_files(self):
         """添加批量处理文件"""
         files = filedialog.askopenfilenames(
-            filetypes=[("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif")]
+            filetypes=[("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif *.tif *.tiff")]
         )
         if files:
             for f in files:
@@ -411,11 +821,16 @@ class ImageProcessorPro:
         if messagebox.askyesno("确认清空", "确定要清空所有文件吗？"):
             self.batch_files.clear()
             self.batch_listbox.delete(0, tk.END)
+            self.preview_failed.clear()
             self.update_batch_previews()
             self.update_status("文件列表已清空")
 
     def process_all(self):
-        """执行批量处理"""
+        """执行批量处理：后台线程把任务交给进程池，界面线程定时刷新进度，结束后汇总失败"""
+        if self.batch_stats is not None:
+            messagebox.showwarning("提示", "已有任务正在处理，请等待完成或先停止。")
+            return
+
         output_dir = os.path.join(os.getcwd(), "CF_OK")
         os.makedirs(output_dir, exist_ok=True)
 
@@ -426,14 +841,20 @@ class ImageProcessorPro:
             if slot['path']:
                 process_queue.append({
                     'path': slot['path'],
-                    'angle': -slot['rotation']
+                    'angle': -slot['rotation'],
+                    'exif_only': self.exif_only_var.get(),
+                    'lossless': self.lossless_var.get(),
+                    'trim': self.trim_var.get()
                 })
 
         # 收集批量模式文件
         if self.batch_files:
             process_queue.extend([{
                 'path': path,
-                'angle': self.current_rotation
+                'angle': self.current_rotation,
+                'exif_only': self.exif_only_var.get(),
+                'lossless': self.lossless_var.get(),
+                'trim': self.trim_var.get()
             } for path in self.batch_files])
 
         total = len(process_queue)
@@ -445,29 +866,136 @@ class ImageProcessorPro:
         progress['maximum'] = total
         progress['value'] = 0
 
-        success_count = 0
-        for idx, item in enumerate(process_queue, 1):
-            try:
-                with Image.open(item['path']) as img:
-                    rotated = img.rotate(item['angle'], expand=True)
-                    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")[:-3]
-                    unique_code = uuid.uuid4().hex[:6]
-                    ext = os.path.splitext(item['path'])[1].lower()
-                    save_path = os.path.join(output_dir, f"{timestamp}_{unique_code}{ext}")
-                    rotated.save(save_path, quality=95)
-
-                    success_count += 1
-                    progress['value'] = idx
-                    self.update_status(f"正在处理：{os.path.basename(item['path'])}")
-                    self.root.update_idletasks()
+        self.stop_event.clear()
+        self.batch_stats = {"total": total, "done": 0, "success": 0, "errors": [],
+                            "output_dir": output_dir, "started": time.perf_counter()}
+        self.set_running(True)
+        runner = self.get_runner()
 
+        def worker():
+            try:
+                for result in runner.run(process_queue, output_dir, self.stop_event.is_set):
+                    self.result_queue.put(result)
             except Exception as e:
-                messagebox.showerror("处理失败", f"{os.path.basename(item['path'])} 处理失败：{str(e)}")
+                self.result_queue.put(RotateResult(None, None, f"处理意外中断：{str(e)}"))
+            finally:
+                self.result_queue.put(None)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(PROGRESS_INTERVAL_MS, self.poll_results)
+
+    def poll_results(self):
+        """界面线程定时取回处理结果，按固定间隔刷新进度条和状态栏"""
+        stats = self.batch_stats
+        finished = False
+        while True:
+            try:
+                result = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                finished = True
+                break
+            stats["done"] += 1 if result.path else 0
+            if result.error:
+                name = os.path.basename(result.path) if result.path else "批处理"
+                stats["errors"].append(f"{name}：{result.error}")
+            else:
+                stats["success"] += 1
 
-        subprocess.Popen(f'explorer "{os.path.normpath(output_dir)}"')
-        messagebox.showinfo("处理完成",
-                            f"成功处理 {success_count}/{total} 个文件\n输出目录已自动打开")
-        progress['value'] = 0
+        self.batch_progress['value'] = stats["done"]
+        stopping = "，正在停止" if self.stop_event.is_set() else ""
+        self.update_status(f"已处理 {stats['done']}/{stats['total']}，失败 {len(stats['errors'])}{stopping}")
+
+        if finished:
+            self.finish_batch()
+        else:
+            self.root.after(PROGRESS_INTERVAL_MS, self.poll_results)
+
+    def finish_batch(self):
+        """批处理结束：失败写入报告文件，一次性提示汇总结果"""
+        stats, self.batch_stats = self.batch_stats, None
+        self.set_running(False)
+        self.batch_progress['value'] = 0
+        errors = stats["errors"]
+        elapsed = time.perf_counter() - stats["started"]
+
+        msg = [f"成功处理 {stats['success']}/{stats['total']} 个文件，用时 {elapsed:.1f} 秒"]
+        if self.stop_event.is_set():
+            msg.append(f"已停止，{stats['total'] - stats['done']} 个文件未处理")
+        if errors:
+            report_path = os.path.join(stats["output_dir"], FAILURE_REPORT_NAME)
+            try:
+                with open(report_path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(errors) + "\n")
+                msg.append(f"失败 {len(errors)} 个，完整列表：{report_path}")
+            except OSError as e:
+                msg.append(f"失败 {len(errors)} 个（写入失败列表出错：{str(e)}）")
+            shown = errors[:MAX_ERROR_DETAILS]
+            if len(errors) > len(shown):
+                shown.append(f"……另有 {len(errors) - len(shown)} 个")
+            msg.append("• " + "\n• ".join(shown))
+        self.update_status(msg[0])
+
+        if stats["success"]:
+            subprocess.Popen(f'explorer "{os.path.normpath(stats["output_dir"])}"')
+            msg.append("输出目录已自动打开")
+        messagebox.showinfo("处理完成", "\n".join(msg))
+
+    def get_runner(self):
+        """返回持久的进程池，多次批处理之间复用"""
+        if self.runner is None:
+            self.runner = RotationRunner()
+        return self.runner
+
+    def set_running(self, running):
+        """处理期间禁用开始按钮，启用停止按钮"""
+        for button in self.process_buttons:
+            button.configure(state=tk.DISABLED if running else tk.NORMAL)
+        for button in self.stop_buttons:
+            button.configure(state=tk.NORMAL if running else tk.DISABLED)
+
+    def on_close(self):
+        """关闭窗口时停止提交并释放工作进程和预览线程"""
+        self.stop_event.set()
+        if self.runner is not None:
+            self.runner.shutdown()
+        self.preview_executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
+    @staticmethod
+    def rotate_file(item, output_dir):
+        """旋转单个文件并保存到输出目录，返回保存路径
+
+        item 中 exif_only 为 True 时直角旋转只改写 JPEG/TIFF 的 EXIF 方向标记；lossless 为 True（默认）且找到
+        jpegtran 时 JPEG 的直角旋转走无损路径；其他格式、任意角度、没有方向标记或无法无损时解码旋转后重新编码。
+        trim 为 True 时允许裁掉不足一个 MCU 的边缘以保持无损。
+        """
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")[:-3]
+        unique_code = uuid.uuid4().hex[:6]
+        ext = os.path.splitext(item['path'])[1].lower()
+        save_path = os.path.join(output_dir, f"{timestamp}_{unique_code}{ext}")
+
+        # item['angle'] 沿用 Image.rotate 的逆时针角度
+        clockwise = -item['angle'] % 360
+        if item.get('exif_only') and clockwise in EXIF_ORIENTATIONS:
+            if rotate_by_exif(item['path'], save_path, clockwise):
+                return save_path
+
+        if item.get('lossless', True) and JPEGTRAN and ext in JPEG_EXTENSIONS and clockwise in EXIF_ORIENTATIONS:
+            try:
+                data = rotate_jpeg_lossless(item['path'], clockwise, item.get('trim', False))
+            except LosslessUnavailable:
+                pass
+            else:
+                with open(save_path, 'wb') as f:
+                    f.write(data)
+                return save_path
+
+        with Image.open(item['path']) as img:
+            rotated = img.rotate(item['angle'], expand=True)
+            rotated.save(save_path, quality=95)
+        return save_path
 
     def update_status(self, message):
         """更新状态栏"""
@@ -490,6 +1018,7 @@ class ImageProcessorPro:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     style = ttk.Style()
     style.theme_use('clam')